@@ -1,56 +1,80 @@
-import pandas as pd
 import streamlit as st
 from io import BytesIO
-def app():
-# Function to transform the data
-    def transform_data(file):
-    # Ensure the file is read properly as a BytesIO object
-        df = pd.read_excel(file, header=None, engine="openpyxl")
-
-    # Step 1: Delete unwanted columns (2, 3, 6, 7, 8 -> index 1, 2, 5, 6, 7)
-        df.drop(columns=[1, 2, 5, 6, 7], inplace=True)
+from collections import namedtuple
+from cache import content_key, upload_digest
+from dates import EXPORT_FORMAT, to_dates
+from export import DATE_FORMAT, XLSX, ExportError, choose_target, download_table, new_workbook, header_format, write_frame
+from ingest import InvalidFileError, read_workbook
+from jobs import run_job
+from schema import constant, derived, project, source
+from timing import show_profile, stage
 
-    # Step 2: Rename the remaining columns
-        df.columns = ["Date", "PRODUIT", "TIERS", "TTC"]
+# Workbook to download, number of rows, and the data table when it is downloaded as CSV/Parquet
+AchatsResult = namedtuple("AchatsResult", ["output", "rows", "data"], defaults=(None,))
 
-    # Step 3: Add empty columns
-        empty_columns = ["N FAC", "IF", "ICE", "MODE REGL", "DATE REGL", "TAUX TVA", "JOURNAL TRESORIE"]
-        for col in empty_columns:
-            df[col] = ""
+# Stages of a run in order, for the progress bar of background jobs
+STAGES = ["read", "transform", "write", "save"]
 
-    # Step 4: Add columns with default 0 value
-        zero_columns = ["TVA", "CPT TVA"]
-        for col in zero_columns:
-            df[col] = 0
+# Output layout of the purchases import, in column order
+# (input columns: 0 = date, 3 = produit, 4 = tiers, 8 = TTC; the others are dropped)
+ACHATS_LAYOUT = [
+    derived("Date", lambda df: to_dates(df[0])),  # Set invalid dates as NaT
+    constant("N FAC", ""),
+    derived("TIERS", lambda df: df[4].astype(str) + "."),
+    constant("IF", ""),
+    constant("ICE", ""),
+    # "PRODUIT / TIERS"
+    derived("DESIGNATION", lambda df: df[3] + " / " + df[4], str),
+    source("TTC", 8, float),
+    # "HT" duplicates "TTC"
+    source("HT", 8, float),
+    constant("TVA", 0, "int64"),
+    constant("MODE REGL", ""),
+    constant("DATE REGL", ""),
+    constant("CPT HT", 6111000000, "int64"),
+    constant("CPT TVA", 0, "int64"),
+    constant("TAUX TVA", ""),
+    constant("JOURNAL TRESORIE", ""),
+]
 
-    # Step 5: Add "CPT HT" column with value 6111000000
-        df["CPT HT"] = 6111000000
+def read_purchases(file):
+    # Ensure the file is read properly as a BytesIO object
+    df = read_workbook(file).frames[0]
+    if df.shape[1] != 9:
+        raise InvalidFileError(f"9 colonnes attendues dans le fichier, mais {df.shape[1]} trouvées. Veuillez vérifier la structure du fichier.")
+    return df
 
-    # Step 6: Duplicate "TTC" column as "HT"
-        df["HT"] = df["TTC"]
+# Function to transform the data
+def transform_data(file, layout=ACHATS_LAYOUT):
+    # Build the output columns in their final order and types at once
+    return project(read_purchases(file), layout)
 
-    # Step 7: Add "DESIGNATION" column as concatenation of "PRODUIT / TIERS" and delete "PRODUIT"
-        df["DESIGNATION"] = df["PRODUIT"] + " / " + df["TIERS"]
-        df.drop(columns=["PRODUIT"], inplace=True)
+def export_data(transformed_data):
+    # Save the transformed data to a BytesIO object
+    output = BytesIO()
+    workbook = new_workbook(output)
+    
+    # Style headers and format the "Date" column as dd/mm/yyyy
+    header = header_format(workbook, "#4B9CD3")
+    date_format = workbook.add_format({"num_format": DATE_FORMAT})
+    with stage("write", len(transformed_data)):
+        write_frame(workbook, "Transformed Data", transformed_data, header, column_formats={"Date": date_format})
+    with stage("save"):
+        workbook.close()
+    return output.getvalue()
 
-    # Step 8: Rearrange columns in the desired order and set data types
-        columns_order = [
-            "Date", "N FAC", "TIERS", "IF", "ICE", "DESIGNATION",
-            "TTC", "HT", "TVA", "MODE REGL", "DATE REGL", "CPT HT",
-            "CPT TVA", "TAUX TVA", "JOURNAL TRESORIE"
-        ]
-        df = df[columns_order]
+def process(file, workbook=True):
+    """AchatsResult of one upload; without workbook, the transformed table is kept instead of an .xlsx."""
+    with stage("read") as record:
+        df = read_purchases(file)
+        record["rows"] = len(df)
+    with stage("transform", len(df)):
+        transformed_data = project(df, ACHATS_LAYOUT)
+    if not workbook:
+        return AchatsResult(None, len(transformed_data), transformed_data)
+    return AchatsResult(export_data(transformed_data), len(transformed_data))
 
-    # Convert data types
-        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")  # Set invalid dates as NaT
-        df["TIERS"] = df["TIERS"].astype(str) + "."
-        df["DESIGNATION"] = df["DESIGNATION"].astype(str)
-        df["TTC"] = df["TTC"].astype(float)
-        df["HT"] = df["HT"].astype(float)
-        df["CPT HT"] = df["CPT HT"].astype(int)
-    
-        return df
-    
+def app():
     # Streamlit app
     st.title("Achats")
     
@@ -60,38 +84,32 @@ def app():
     if uploaded_file:
         # Transform the uploaded file
         try:
-            transformed_data = transform_data(uploaded_file)
-    
-            # Save the transformed data to a BytesIO object
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine="openpyxl") as writer:
-                transformed_data.to_excel(writer, index=False, sheet_name="Transformed Data")
-                workbook = writer.book
-                worksheet = writer.sheets["Transformed Data"]
-    
-                # Aooly formatting to the "Date" column
-                from openpyxl.styles.numbers import FORMAT_DATE_DMYSLASH
-                for col in worksheet.iter_cols(min_col=1, max_col=1, min_row=2, max_row=worksheet.max_row):
-                    for cell in col:
-                        cell.number_format = FORMAT_DATE_DMYSLASH #Set date format as dd/mm/yyyy
-              
-                # Style headers
-                from openpyxl.styles import PatternFill, Font
-                header_fill = PatternFill(start_color="4B9CD3", end_color="4B9CD3", fill_type="solid")
-                header_font = Font(color="FFFFFF", bold=True)
-                for cell in worksheet[1]:  # First row (headers)
-                    cell.fill = header_fill
-                    cell.font = header_font
-    
+            # Excel workbook, or the same table as CSV/Parquet
+            target, csv_options = choose_target("ACHATS")
+            workbook = target == XLSX
+            
+            # Reruns (e.g. clicking the download button, polling the job) reuse the result of the same upload
+            key = content_key("ACHATS", upload_digest(uploaded_file), workbook)
+            # Run in the background; the page polls the job until the workbook is ready
+            finished = run_job("ACHATS", key, lambda: process(BytesIO(uploaded_file.getvalue()), workbook), STAGES)
+            if finished is None:
+                return
+            result, profile = finished
+            show_profile(profile)
+            
             # Convert BytesIO to downloadable file
-            output.seek(0)
             st.success("Votre fichier est prêt! 😎")
+            if not workbook:
+                download_table(result.data, "Import_Achats", target, csv_options, EXPORT_FORMAT)
+                return
             st.download_button(
                 label="Telecharger le fichier",
-                data=output,
+                data=result.output,
                 file_name="Import_Achats.xlsx",
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
             )
+        except (InvalidFileError, ExportError) as e:
+            st.error(str(e))
         except Exception as e:
             st.error(f"An error occurred: {e}")
 if __name__ == "__main__":
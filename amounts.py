@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+
+# Amounts are handled as int64 cents from ingestion to export: sums and
+# equality checks are exact, and only the written workbook shows decimals
+
+
+def cents(amount):
+    """One amount (e.g. a constant of the rules) in cents."""
+    return int(round(amount * 100))
+
+
+def to_cents(values):
+    """Amount column (numbers or numeric text) as int64 cents, 0 for empty or invalid cells."""
+    amounts = pd.to_numeric(values, errors="coerce").fillna(0).astype(float)
+    return np.round(amounts * 100).astype(np.int64)
+
+
+def with_decimals(df, columns):
+    """Copy of df with the cents columns as decimal amounts, for display and export."""
+    return df.assign(**{column: df[column] / 100 for column in columns})
@@ -1,55 +1,19 @@
-import pandas as pd
 import streamlit as st
 from io import BytesIO
+from export import DATE_FORMAT, new_workbook, header_format, write_frame
+import achats
+from achats import ACHATS_LAYOUT
+from schema import derived
+
+# Same layout as ACHATS, without the "." suffix on TIERS
+APP_LAYOUT = [
+    derived("TIERS", lambda df: df[4].astype(str)) if column.name == "TIERS" else column
+    for column in ACHATS_LAYOUT
+]
 
 # Function to transform the data
 def transform_data(file):
-    # Ensure the file is read properly as a BytesIO object
-    df = pd.read_excel(file, header=None, engine="openpyxl")
-
-    # Step 1: Delete unwanted columns (2, 3, 6, 7, 8 -> index 1, 2, 5, 6, 7)
-    df.drop(columns=[1, 2, 5, 6, 7], inplace=True)
-
-    # Step 2: Rename the remaining columns
-    df.columns = ["Date", "PRODUIT", "TIERS", "TTC"]
-
-    # Step 3: Add empty columns
-    empty_columns = ["N FAC", "IF", "ICE", "MODE REGL", "DATE REGL", "TAUX TVA", "JOURNAL TRESORIE"]
-    for col in empty_columns:
-        df[col] = ""
-
-    # Step 4: Add columns with default 0 value
-    zero_columns = ["TVA", "CPT TVA"]
-    for col in zero_columns:
-        df[col] = 0
-
-    # Step 5: Add "CPT HT" column with value 6111000000
-    df["CPT HT"] = 6111000000
-
-    # Step 6: Duplicate "TTC" column as "HT"
-    df["HT"] = df["TTC"]
-
-    # Step 7: Add "DESIGNATION" column as concatenation of "PRODUIT / TIERS" and delete "PRODUIT"
-    df["DESIGNATION"] = df["PRODUIT"] + " / " + df["TIERS"]
-    df.drop(columns=["PRODUIT"], inplace=True)
-
-    # Step 8: Rearrange columns in the desired order and set data types
-    columns_order = [
-        "Date", "N FAC", "TIERS", "IF", "ICE", "DESIGNATION",
-        "TTC", "HT", "TVA", "MODE REGL", "DATE REGL", "CPT HT",
-        "CPT TVA", "TAUX TVA", "JOURNAL TRESORIE"
-    ]
-    df = df[columns_order]
-
-    # Convert data types
-    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")  # Set invalid dates as NaT
-    df["TIERS"] = df["TIERS"].astype(str)
-    df["DESIGNATION"] = df["DESIGNATION"].astype(str)
-    df["TTC"] = df["TTC"].astype(float)
-    df["HT"] = df["HT"].astype(float)
-    df["CPT HT"] = df["CPT HT"].astype(int)
-
-    return df
+    return achats.transform_data(file, APP_LAYOUT)
 
 # Streamlit app
 st.title("SOYAPRIM Data Transformation")
@@ -64,25 +28,14 @@ if uploaded_file:
 
         # Save the transformed data to a BytesIO object
         output = BytesIO()
-        with pd.ExcelWriter(output, engine="openpyxl") as writer:
-            transformed_data.to_excel(writer, index=False, sheet_name="Transformed Data")
-            workbook = writer.book
-            worksheet = writer.sheets["Transformed Data"]
-
-            # Aooly formatting to the "Date" column
-            from openpyxl.styles.numbers import FORMAT_DATE_DMYSLASH
-            for col in worksheet.iter_cols(min_col=1, max_col=1, min_row=2, max_row=worksheet.max_row):
-                for cell in col:
-                    cell.number_format = FORMAT_DATE_DMYSLASH #Set date format as dd/mm/yyyy
-          
-            # Style headers
-            from openpyxl.styles import PatternFill, Font
-            header_fill = PatternFill(start_color="4B9CD3", end_color="4B9CD3", fill_type="solid")
-            header_font = Font(color="FFFFFF", bold=True)
-            for cell in worksheet[1]:  # First row (headers)
-                cell.fill = header_fill
-                cell.font = header_font
-
+        workbook = new_workbook(output)
+        
+        # Style headers and format the "Date" column as dd/mm/yyyy
+        header = header_format(workbook, "#4B9CD3")
+        date_format = workbook.add_format({"num_format": DATE_FORMAT})
+        write_frame(workbook, "Transformed Data", transformed_data, header, column_formats={"Date": date_format})
+        workbook.close()
+        
         # Convert BytesIO to downloadable file
         output.seek(0)
         st.success("File transformed successfully! :)")
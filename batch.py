@@ -0,0 +1,124 @@
+"""Run the BANQUE / REFERENCE / ACHATS transformations without Streamlit.
+
+    python batch.py banque releves/ autre_releve.xlsx --workers 4
+
+Each input file gets its output written next to it, e.g. releve.xlsx ->
+releve_import_awb.xlsx, and a summary line is printed per file. BANQUE
+statements without a mappings sheet all use the master list known when
+the batch starts, whatever the other files of the batch compile meanwhile.
+"""
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Module of each app and suffix of the output file written next to the input
+MODES = {
+    "banque": ("bq", "import_awb"),
+    "reference": ("bq_ref", "donnees_awb"),
+    "achats": ("achats", "Import_Achats"),
+}
+
+# Master mappings of the batch in a worker process, see init_worker
+_master = None
+
+
+def output_path(path, mode):
+    stem, _ = os.path.splitext(path)
+    return f"{stem}_{MODES[mode][1]}.xlsx"
+
+
+def is_output(path):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return any(stem.endswith("_" + suffix) for _, suffix in MODES.values())
+
+
+def find_inputs(paths):
+    # Files are taken as given, directories are scanned for .xlsx files (skipping our outputs)
+    inputs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                file_path = os.path.join(path, name)
+                if (name.lower().endswith(".xlsx") and not name.startswith("~$")
+                        and os.path.isfile(file_path) and not is_output(file_path)):
+                    inputs.append(file_path)
+        else:
+            inputs.append(path)
+    return inputs
+
+
+def init_worker(master):
+    global _master
+    _master = master
+
+
+def run_file(mode, path):
+    """Transform one file in a worker process and write its output; returns a summary dict."""
+    import importlib
+    from ingest import InvalidFileError
+
+    start = time.perf_counter()
+    summary = {"file": path, "rows": None, "unmapped": None, "error": None}
+    try:
+        module = importlib.import_module(MODES[mode][0])
+        # Statements without a mappings sheet fall back to the master list resolved by the parent
+        options = {"master": _master} if mode == "banque" else {}
+        with open(path, "rb") as f:
+            result = module.process(f, **options)
+        with open(output_path(path, mode), "wb") as f:
+            f.write(result.output)
+        summary["rows"] = result.rows
+        summary["unmapped"] = getattr(result, "unmapped", None)
+    except InvalidFileError as e:
+        summary["error"] = str(e)
+    except Exception as e:
+        summary["error"] = f"{type(e).__name__}: {e}"
+    summary["elapsed"] = time.perf_counter() - start
+    return summary
+
+
+def format_summary(summary):
+    name = os.path.basename(summary["file"])
+    if summary["error"]:
+        return f"{name:<40} ERREUR  {summary['error']}"
+    unmapped = "-" if summary["unmapped"] is None else summary["unmapped"]
+    return f"{name:<40} {summary['rows']:>8} {unmapped:>10} {summary['elapsed']:>8.2f}s"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Traitement par lot des fichiers BANQUE / REFERENCE / ACHATS")
+    parser.add_argument("mode", choices=sorted(MODES), help="transformation à appliquer")
+    parser.add_argument("paths", nargs="+", help="fichiers .xlsx ou dossiers")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="nombre de processus (défaut : nombre de coeurs)")
+    args = parser.parse_args(argv)
+
+    inputs = find_inputs(args.paths)
+    if not inputs:
+        print("Aucun fichier .xlsx trouvé.", file=sys.stderr)
+        return 1
+
+    print(f"{'FICHIER':<40} {'LIGNES':>8} {'NON MAPPÉ':>10} {'DURÉE':>9}")
+    start = time.perf_counter()
+    failures = 0
+    # Resolved once: workers compiling their own mappings sheets move the "latest" pointer meanwhile
+    master = None
+    if args.mode == "banque":
+        from mapping_cache import MAPPINGS
+        master = MAPPINGS.latest()
+
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(inputs))),
+                             initializer=init_worker, initargs=(master,)) as pool:
+        futures = [pool.submit(run_file, args.mode, path) for path in inputs]
+        for future in as_completed(futures):
+            summary = future.result()
+            failures += bool(summary["error"])
+            print(format_summary(summary), flush=True)
+
+    print(f"{len(inputs)} fichier(s), {failures} erreur(s), {time.perf_counter() - start:.2f}s au total")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""Synthetic inputs for the benchmarks, deterministic for a given size and seed.
+
+    python bench/generate.py --sizes 1k,10k,100k --mapping-size 2000
+"""
+import os
+import argparse
+import datetime as dt
+import numpy as np
+import xlsxwriter
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+SEED = 20240101
+
+# Words found in real counterparties: suppliers and farmers known to the rules, and plain names
+SUPPLIERS = ["ORANGE", "MAMDA", "ONSSA", "ASWAK", "BRICO", "CARREFOUR", "REDAL", "KITEA", "MARJANE", "GLOBUS",
+             "INWI", "ELECTROPLANET", "SECOLA", "TEMARA PRINT", "DAKAR BOIS", "SMURFIT", "PLANEX", "LVS", "KPA", "AJYAD"]
+FARMERS = ["HAMZA", "YOUSSEF", "RACHID", "BRAHIM", "KHALID", "AMINE", "MOHAMED", "HASSAN", "AHMED", "MILOUD"]
+OTHERS = ["ATLAS", "NOUR", "SAHARA", "RIF", "OASIS", "ZITOUNA", "ARGANE", "MEDINA", "SOUSS", "TAFILALET"]
+SPECIAL_TIERS = ["DGI", "dgi", "CNSS", "WAFABAIL", "abdelatif saidou(medecin)", "CAISSE", "VIGNETTE 2024",
+                 "FRUL 01", "SALAIRE", "ettoumy", "relance client"]
+LIBS = ["VIREMENT EMIS", "VIREMENT RECU", "PRLV SEPA", "FRAIS TENUE COMPTE", "COMMISSION", "REMISE CHEQUE",
+        "CHANGE DEVISE", "PAIEMENT CB", "RETRAIT", None]
+REFS = [None] * 12 + ["CONGÉ", "PAIE", "COTIS", "FRAIS", "PERTE", "GAIN", "FELAH", "IR", "FAC 2024"]
+WAFABAIL_AMOUNTS = [28780.38, 13790.77, 10204.08, 20408.17, 20139.84]
+PRODUCTS = ["LAIT", "BLE", "ORGE", "MAIS", "FOIN", "PAILLE", "OLIVES", "AMANDES"]
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    factor = {"k": 1000, "m": 1000000}.get(text[-1], 1)
+    return int(float(text.rstrip("km")) * factor)
+
+
+def mapping_keys(size):
+    # Key i contains the counterparty name used in statements, value is the accounting TIERS
+    words = SUPPLIERS + FARMERS + OTHERS
+    keys = [f"STE {words[i % len(words)]} {i:05d} SARL" for i in range(size)]
+    values = [f"TIERS {words[i % len(words)]} {i:05d}" for i in range(size)]
+    return keys, values
+
+
+def statement_columns(rng, rows, mapping_size):
+    words = SUPPLIERS + FARMERS + OTHERS
+
+    # 60% counterparties from the mappings, 15% special cases, 25% unknown ones
+    kind = rng.random(rows)
+    mapped = rng.integers(0, mapping_size, rows)
+    unknown = rng.integers(0, 500, rows)
+    special = rng.integers(0, len(SPECIAL_TIERS), rows)
+    tiers = np.where(
+        kind < 0.60,
+        np.array([f"{words[i % len(words)]} {i:05d}" for i in range(mapping_size)], dtype=object)[mapped],
+        np.where(
+            kind < 0.75,
+            np.array(SPECIAL_TIERS, dtype=object)[special],
+            np.array([f"CLIENT {OTHERS[i % len(OTHERS)]} {i}" for i in range(500)], dtype=object)[unknown],
+        ),
+    )
+
+    debit = np.round(rng.uniform(10, 120000, rows), 2)
+    amount_kind = rng.random(rows)
+    debit = np.where(amount_kind < 0.02, 734.0, debit)
+    debit = np.where((amount_kind >= 0.02) & (amount_kind < 0.05), rng.choice(WAFABAIL_AMOUNTS, rows), debit)
+    credit = np.round(rng.uniform(10, 20000, rows), 2)
+    is_debit = rng.random(rows) < 0.7
+    debit = np.where(is_debit, debit, np.nan)
+    credit = np.where(is_debit, np.nan, credit)
+
+    start = dt.datetime(2024, 1, 1)
+    dates = [start + dt.timedelta(days=int(d)) for d in rng.integers(0, 366, rows)]
+
+    return {
+        "DATE": dates,
+        "RAW_LIB": rng.choice(np.array(LIBS, dtype=object), rows),
+        "RAW_TIER": tiers,
+        "RAW_REF": rng.choice(np.array(REFS, dtype=object), rows),
+        "DEBIT": debit,
+        "CREDIT": credit,
+        "CA": np.where(rng.random(rows) < 0.05, 1, None),
+    }
+
+
+def write_rows(worksheet, columns, date_format):
+    for row_idx, row in enumerate(zip(*columns)):
+        for col_idx, value in enumerate(row):
+            if value is None or (isinstance(value, float) and np.isnan(value)):
+                continue
+            if isinstance(value, dt.datetime):
+                worksheet.write_datetime(row_idx, col_idx, value, date_format)
+            else:
+                worksheet.write(row_idx, col_idx, value)
+
+
+def write_workbook(path, sheets):
+    # Default mode, not constant_memory: text goes to one shared-strings table for all sheets, like Excel saves it
+    workbook = xlsxwriter.Workbook(path)
+    date_format = workbook.add_format({"num_format": "dd/mm/yyyy"})
+    for name, columns in sheets:
+        write_rows(workbook.add_worksheet(name), columns, date_format)
+    workbook.close()
+
+
+def bank_path(rows, mapping_size):
+    return os.path.join(DATA_DIR, f"banque_{rows}_m{mapping_size}.xlsx")
+
+
+def reference_path(rows, mapping_size):
+    return os.path.join(DATA_DIR, f"reference_{rows}_m{mapping_size}.xlsx")
+
+
+def purchases_path(rows):
+    return os.path.join(DATA_DIR, f"achats_{rows}.xlsx")
+
+
+def generate_bank(rows, mapping_size):
+    """AWB-style 7-column statement and its mappings sheet (BANQUE input)."""
+    path = bank_path(rows, mapping_size)
+    if not os.path.exists(path):
+        rng = np.random.default_rng(SEED + rows)
+        columns = statement_columns(rng, rows, mapping_size)
+        write_workbook(path, [("Releve", list(columns.values())), ("Mappings", list(mapping_keys(mapping_size)))])
+    return path
+
+
+def generate_reference(rows, mapping_size):
+    """7-column statement with an ignored second column (REFERENCE input)."""
+    path = reference_path(rows, mapping_size)
+    if not os.path.exists(path):
+        rng = np.random.default_rng(SEED + rows)
+        columns = statement_columns(rng, rows, mapping_size)
+        sheet = [columns["DATE"], ["AWB"] * rows, columns["RAW_LIB"], columns["RAW_TIER"],
+                 columns["RAW_REF"], columns["DEBIT"], columns["CREDIT"]]
+        write_workbook(path, [("Releve", sheet), ("Mappings", list(mapping_keys(mapping_size)))])
+    return path
+
+
+def generate_purchases(rows):
+    """9-column purchases sheet (ACHATS input)."""
+    path = purchases_path(rows)
+    if not os.path.exists(path):
+        rng = np.random.default_rng(SEED + rows)
+        start = dt.datetime(2024, 1, 1)
+        dates = [start + dt.timedelta(days=int(d)) for d in rng.integers(0, 366, rows)]
+        farmers = np.array([f"{name} {i}" for i, name in enumerate(FARMERS * 20)], dtype=object)
+        sheet = [
+            dates, ["BL"] * rows, ["X"] * rows,
+            rng.choice(np.array(PRODUCTS, dtype=object), rows), rng.choice(farmers, rows),
+            [1] * rows, ["KG"] * rows, [0] * rows,
+            np.round(rng.uniform(50, 25000, rows), 2),
+        ]
+        write_workbook(path, [("Achats", sheet)])
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Génère les fichiers synthétiques des benchmarks")
+    parser.add_argument("--sizes", default="1k,10k,100k,1m", help="nombres de lignes, ex. 1k,10k")
+    parser.add_argument("--mapping-size", type=int, default=2000, help="lignes de la feuille de mappage")
+    args = parser.parse_args(argv)
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    for rows in map(parse_size, args.sizes.split(",")):
+        for path in (generate_bank(rows, args.mapping_size), generate_reference(rows, args.mapping_size),
+                     generate_purchases(rows)):
+            print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Time each pipeline stage on synthetic inputs and check outputs against a frozen baseline.
+
+    python bench/run.py --sizes 1k,10k --apps banque,reference,achats
+    python bench/run.py --sizes 1k,10k --update-baseline   # after an intended output change
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import tracemalloc
+from io import BytesIO
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from openpyxl import load_workbook  # noqa: E402
+from generate import (  # noqa: E402
+    DATA_DIR, parse_size, generate_bank, generate_reference, generate_purchases,
+)
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+class StageTimer:
+    """Wall time, rows and (optionally) peak traced memory of each stage."""
+
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, rows):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if self.trace_memory else None
+        self.stages.append((name, rows, elapsed, peak))
+
+
+def bench_banque(path, timer):
+    import bq
+    with timer.stage("read", 0):
+        raw_df, mapping_index = bq.read_statement(path)
+    rows = len(raw_df)
+    with timer.stage("split", rows):
+        raw_df = bq.prepare(raw_df)
+    with timer.stage("lookup", rows):
+        raw_df["TIERS"] = bq.assign_tiers(raw_df, mapping_index)
+        raw_df[bq.SUGGESTION_COLUMNS] = bq.suggest_tiers(raw_df, mapping_index)
+    with timer.stage("classify", rows):
+        raw_df["CPT"] = bq.classify(raw_df)
+        raw_df["LIB"] = bq.build_lib(raw_df)
+        result_df = bq.finalize(raw_df)
+    with timer.stage("pivot", rows):
+        cpt_pivot, tiers_pivot = bq.build_pivots(result_df)
+    with timer.stage("export", rows):
+        output = bq.export_workbook(result_df, cpt_pivot, tiers_pivot)
+    return output
+
+
+def bench_reference(path, timer):
+    import bq_ref
+    with timer.stage("read", 0):
+        df, original_refs = bq_ref.read_reference(path)
+    rows = len(df)
+    with timer.stage("classify", rows):
+        refs = bq_ref.classify_refs(df, original_refs)
+    with timer.stage("export", rows):
+        output = bq_ref.build_workbook(df, refs, original_refs, path)
+    return output
+
+
+def bench_achats(path, timer):
+    import achats
+    from schema import project
+    with timer.stage("read", 0):
+        df = achats.read_purchases(path)
+    rows = len(df)
+    with timer.stage("transform", rows):
+        transformed = project(df, achats.ACHATS_LAYOUT)
+    with timer.stage("export", rows):
+        output = achats.export_data(transformed)
+    return output
+
+
+APPS = {
+    "banque": (bench_banque, generate_bank),
+    "reference": (bench_reference, generate_reference),
+    "achats": (bench_achats, lambda rows, mapping_size: generate_purchases(rows)),
+}
+
+
+def output_digest(output):
+    # Hash of the cell values of every sheet, independent of zip timestamps and styles
+    digest = hashlib.sha256()
+    workbook = load_workbook(BytesIO(output), read_only=True)
+    for worksheet in workbook.worksheets:
+        digest.update(worksheet.title.encode())
+        for row in worksheet.iter_rows(values_only=True):
+            digest.update(repr(row).encode())
+    workbook.close()
+    return digest.hexdigest()
+
+
+def run_case(app, rows, mapping_size, trace_memory):
+    bench, generate = APPS[app]
+    path = generate(rows, mapping_size)
+
+    timer = StageTimer(trace_memory=False)
+    output = bench(path, timer)
+    stages = timer.stages
+
+    # Second pass under tracemalloc: its overhead would distort the timings
+    if trace_memory:
+        tracemalloc.start()
+        memory_timer = StageTimer(trace_memory=True)
+        bench(path, memory_timer)
+        tracemalloc.stop()
+        stages = [stage[:3] + (memory[3],) for stage, memory in zip(stages, memory_timer.stages)]
+
+    # The read stage processes the file's rows too
+    data_rows = max(stage[1] for stage in stages)
+    stages = [(name, data_rows if name == "read" else n, elapsed, peak) for name, n, elapsed, peak in stages]
+    return stages, output
+
+
+def print_stages(app, rows, stages):
+    for name, n, elapsed, peak in stages:
+        throughput = f"{n / elapsed:>12,.0f}" if elapsed > 0 else f"{'-':>12}"
+        memory = f"{peak / 1e6:>10.1f}" if peak is not None else f"{'-':>10}"
+        print(f"{app:<10} {rows:>9,} {name:<10} {elapsed:>9.3f} {throughput} {memory}")
+    total = sum(stage[2] for stage in stages)
+    print(f"{app:<10} {rows:>9,} {'TOTAL':<10} {total:>9.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks BANQUE / REFERENCE / ACHATS")
+    parser.add_argument("--sizes", default="1k,10k", help="nombres de lignes, ex. 1k,10k,100k,1m")
+    parser.add_argument("--apps", default="banque,reference,achats")
+    parser.add_argument("--mapping-size", type=int, default=2000)
+    parser.add_argument("--no-memory", action="store_true", help="sans mesure de mémoire (plus rapide)")
+    parser.add_argument("--no-check", action="store_true", help="sans comparaison à la référence")
+    parser.add_argument("--update-baseline", action="store_true", help="enregistre les sorties comme référence")
+    args = parser.parse_args(argv)
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+
+    print(f"{'APP':<10} {'LIGNES':>9} {'ETAPE':<10} {'SECONDES':>9} {'LIGNES/S':>12} {'PIC MO':>10}")
+    mismatches = []
+    for rows in map(parse_size, args.sizes.split(",")):
+        for app in args.apps.split(","):
+            stages, output = run_case(app, rows, args.mapping_size, not args.no_memory)
+            print_stages(app, rows, stages)
+
+            if args.no_check and not args.update_baseline:
+                continue
+            key = f"{app}/{rows}/m{args.mapping_size}"
+            digest = output_digest(output)
+            if args.update_baseline:
+                baseline[key] = digest
+            elif key not in baseline:
+                print(f"{key}: pas de référence (lancer avec --update-baseline)")
+            elif baseline[key] != digest:
+                mismatches.append(key)
+                print(f"{key}: SORTIE DIFFERENTE DE LA REFERENCE")
+            else:
+                print(f"{key}: identique à la référence")
+
+    if args.update_baseline:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(dict(sorted(baseline.items())), f, indent=2)
+            f.write("\n")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""Startup profile: import time of what main.py needs before the sidebar renders, and of each app.
+
+    python bench/startup.py
+    python bench/startup.py --top 15
+
+Each target is imported in a fresh interpreter (python -X importtime), so
+the times are those of a cold server process; an app's time includes the
+packages it shares with main.py (streamlit).
+"""
+import os
+import sys
+import argparse
+import subprocess
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported by main.py at the top, then by each page once selected
+TARGETS = {
+    "main": "import streamlit, warmup",
+    "banque": "import bq",
+    "reference": "import bq_ref",
+    "achats": "import achats",
+}
+
+
+def import_times(statement):
+    """Import time in seconds per top-level package (own time of all its modules) for statement."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    times = defaultdict(float)
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        times[name.strip().split(".")[0]] += int(own) / 1e6
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Temps d'import au démarrage")
+    parser.add_argument("--top", type=int, default=8, help="nombre de modules détaillés par cible")
+    args = parser.parse_args(argv)
+
+    print(f"{'CIBLE':<10} {'MODULE':<20} {'SECONDES':>9}")
+    for target, statement in TARGETS.items():
+        times = import_times(statement)
+        print(f"{target:<10} {'TOTAL':<20} {sum(times.values()):>9.3f}")
+        for name, seconds in sorted(times.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"{'':<10} {name:<20} {seconds:>9.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,420 +1,501 @@
+import os
+import zipfile
+import contextvars
 import streamlit as st
 import pandas as pd
 import numpy as np
 import datetime as dt
 from io import BytesIO
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import PatternFill, Font
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from amounts import cents, to_cents, with_decimals
+from cache import RESULTS, content_key, per_upload, upload_digest
+from dates import EXPORT_FORMAT, format_dates, to_dates
+from export import XLSX, ExportError, choose_target, download_table, new_workbook, header_format, column_widths, write_frame
+from fingerprints import open_store, row_fingerprints
+from ingest import InvalidFileError, read_workbook, sheet_digest
+from jobs import run_job
+from mapping_cache import MAPPINGS
+from rollup import DETAIL, rollup
+from rules import load_rules
+from timing import show_profile, stage
+
+# Preview rows of the transformed data, the workbook to download, row counts for summaries,
+# and the data table when it is downloaded as CSV/Parquet instead of a workbook
+BanqueResult = namedtuple("BanqueResult", ["preview", "output", "rows", "unmapped", "data"], defaults=(None,))
+
+# Stages of a run in order, for the progress bar of background jobs
+STAGES = ["read", "dgi_split", "lookup_tiers", "cpt_rules", "suggestions", "lib", "sort", "pivots", "write", "save"]
+
+# Rows of each statement transformed for the preview shown before the full run
+PREVIEW_ROWS = 300
+
+# Statements transformed at the same time for a multi-file upload
+MAX_WORKERS = 4
+
+# DGI payments of this amount are two withholdings paid together, split as (RAW_REF, DEBIT)
+DGI_SPLIT_AMOUNT = cents(734)
+DGI_SPLIT = [("RETENU MEDECIN", cents(400)), ("RETENU AVOCAT", cents(334))]
+
+# Wafabail leasing contract of each monthly DEBIT amount
+WAFABAIL_CONTRACTS = {
+    cents(28780.38): "WAFABAIL CONTRAT S0514740 SMARTEC",
+    cents(13790.77): "WAFABAIL CONTRAT S0623820 FORGEZ DE BASAS",
+    cents(10204.08): "WAFABAIL CONTRAT S0514750 MAP MAGHREB",
+    cents(20408.17): "WAFABAIL CONTRAT S0514770 MAP MAGHREB",
+    cents(20139.84): "WAFABAIL CONTRAT S0514770 MAP MAGHREB",
+}
+
+# Amount columns, in cents until export
+AMOUNT_COLUMNS = ["DEBIT", "CREDIT"]
+
+# Mapping entries suggested for each row left without TIERS, as (suggestion, score) column pairs
+SUGGESTIONS = 3
+# Lowest trigram similarity worth suggesting (below, a shared syllable or two: noise)
+MIN_SCORE = 0.2
+SUGGESTION_COLUMNS = [column for n in range(1, SUGGESTIONS + 1) for column in (f"SUGGESTION {n}", f"SCORE {n}")]
+
+# Columns of the Données Transformées sheet (the suggestions only go to Détails Tiers)
+DATA_COLUMNS = ["DATE", "N PIECE", "CPT", "TIERS", "LIB", "REF", "DEBIT", "CREDIT"]
+
+# Inputs of the per-row classification (fingerprinted) and its outputs (reused when the fingerprint is known)
+FINGERPRINT_COLUMNS = ["DATE", "RAW_LIB", "RAW_TIER", "RAW_REF", "DEBIT", "CREDIT", "CA"]
+CLASSIFIED_COLUMNS = ["TIERS", "CPT"]
+
+def split_dgi_rows(raw_df):
+    """Replace each DGI row with DEBIT=734 by its RETENU MEDECIN / RETENU AVOCAT rows, appended at the end."""
+    # The amount test is cheap and rules out almost every row before the text test
+    to_split = (raw_df["DEBIT"] == DGI_SPLIT_AMOUNT).to_numpy()
+    to_split[to_split] = raw_df.loc[to_split, "RAW_TIER"].astype(str).str.contains("dgi", case=False).to_numpy(dtype=bool)
+    if not to_split.any():
+        return raw_df
+    
+    # Repeat each row once per part, then assign the parts column-wise
+    split_df = raw_df.loc[raw_df.index[to_split].repeat(len(DGI_SPLIT))]
+    refs, debits = zip(*DGI_SPLIT)
+    split_df["RAW_REF"] = np.tile(np.array(refs, dtype=object), int(to_split.sum()))
+    split_df["DEBIT"] = np.tile(debits, int(to_split.sum()))
+    
+    # Remove the original rows and add the new rows
+    return pd.concat([raw_df[~to_split], split_df], ignore_index=True)
+
+def lib_part(values):
+    # Stripped text of each cell, "" for empty cells
+    return values.astype(str).str.strip().where(values.notna(), "")
+
+def build_lib(raw_df):
+    """Join RAW_LIB / RAW_REF / TIERS (or RAW_TIER when TIERS is empty) with " / ", skipping empty parts."""
+    parts = [
+        lib_part(raw_df["RAW_LIB"]),
+        lib_part(raw_df["RAW_REF"]),
+        lib_part(raw_df["TIERS"]).where(raw_df["TIERS"].notna(), lib_part(raw_df["RAW_TIER"])),
+    ]
+    lib = parts[0]
+    for part in parts[1:]:
+        separator = np.where((lib != "") & (part != ""), " / ", "")
+        lib = lib + separator + part
+    return lib
+
+def read_statement(file, max_rows=None, master=None):
+    """Raw statement (sheet 1) with named columns and the compiled mappings (sheet 2, or the master list).
+    
+    With max_rows, only the first rows of the statement are read (the mappings are always read whole).
+    The master list is `master` if given, else the last compiled mappings.
+    """
+    # A mappings sheet already compiled is recognized from its XML values, without building its DataFrame
+    alias = sheet_digest(file, 1)
+    mapping_index = MAPPINGS.by_alias(alias) if alias else None
+    
+    # Read raw data (Sheet 1) and, when needed, mappings (Sheet 2) in a single pass
+    workbook = read_workbook(file, sheets=[0] if mapping_index is not None else [0, 1], max_rows={0: max_rows})
+    raw_df = workbook.frames[0]
+    mappings_df = workbook.frames.get(1)  # Assuming no headers in Sheet 2
+    
+    # Validate the number of columns in the raw file
+    if mapping_index is None and mappings_df is None:
+        mapping_index = master if master is not None else MAPPINGS.latest()
+        if mapping_index is None:
+            raise InvalidFileError("La feuille de mappage (2ème feuille) est introuvable et aucune table de mappage n'est connue. Veuillez vérifier la structure du fichier.")
+    if raw_df.shape[1] != 7:
+        raise InvalidFileError(f"8 colonnes attendues dans le fichier, mais {raw_df.shape[1]} trouvées. Veuillez vérifier la structure du fichier.")
+    if mapping_index is None:
+        if mappings_df.shape[1] < 2:
+            raise InvalidFileError(f"Au moins 2 colonnes attendues dans la feuille de mappage, mais {mappings_df.shape[1]} trouvées. Veuillez vérifier la structure du fichier.")
+        mapping_index = MAPPINGS.compile(mappings_df, alias)
+    
+    # Assign column names to raw data (7 columns)
+    raw_df.columns = [
+        "DATE", "RAW_LIB", "RAW_TIER", "RAW_REF", 
+        "DEBIT", "CREDIT", "CA"
+    ]
+    return raw_df, mapping_index
+
+# Process TIERS (lookup RAW_TIER as wildcard in mappings sheet)
+def lookup_tiers(raw_tier, mapping_index):
+    """TIERS of one distinct RAW_TIER, and whether its Wafabail contract depends on the amount."""
+    # Special case for "abdelatif saidou(medecin)"
+    if isinstance(raw_tier, str) and "saidou" in raw_tier.lower() and "medecin" in raw_tier.lower():
+        return "SAIDOU ABDELLATIPH", False
+    
+    # First mapping whose key contains RAW_TIER (wildcard), via the prebuilt index
+    wafabail = isinstance(raw_tier, str) and "wafabail" in raw_tier.lower()
+    return mapping_index.find(raw_tier), wafabail
+
+def suggest_tiers(raw_df, mapping_index):
+    """Suggestion columns for the rows without TIERS, computed once per distinct RAW_TIER."""
+    suggestions = pd.DataFrame(np.nan, index=raw_df.index, columns=SUGGESTION_COLUMNS, dtype=object)
+    unmapped = (raw_df["TIERS"].isna() & raw_df["RAW_TIER"].notna()).to_numpy()
+    if not unmapped.any():
+        return suggestions
+    
+    codes, raw_tiers = pd.factorize(raw_df.loc[unmapped, "RAW_TIER"])
+    table = np.full((len(raw_tiers), len(SUGGESTION_COLUMNS)), np.nan, dtype=object)
+    for tier_idx, raw_tier in enumerate(raw_tiers):
+        for n, (value, score) in enumerate(mapping_index.suggest(raw_tier, SUGGESTIONS, MIN_SCORE)):
+            table[tier_idx, 2 * n:2 * n + 2] = value, score
+    suggestions.loc[unmapped, :] = table[codes]
+    return suggestions
+
+def prepare(raw_df):
+    """DEBIT/CREDIT in cents and DGI rows split."""
+    # Convert amounts to integer cents once, they stay so until export
+    raw_df["DEBIT"] = to_cents(raw_df["DEBIT"])
+    raw_df["CREDIT"] = to_cents(raw_df["CREDIT"])
+    
+    # Split DGI rows with DEBIT=734 into RETENU MEDECIN and RETENU AVOCAT rows
+    return split_dgi_rows(raw_df)
+
+def assign_tiers(raw_df, mapping_index):
+    """TIERS of each row, looked up once per distinct RAW_TIER and broadcast through the codes."""
+    codes, raw_tiers = pd.factorize(raw_df["RAW_TIER"])
+    
+    # Empty RAW_TIER (code -1) picks the extra last entry: no TIERS
+    found = [lookup_tiers(raw_tier, mapping_index) for raw_tier in raw_tiers]
+    tiers = np.array([tier for tier, _ in found] + [np.nan], dtype=object)[codes]
+    wafabail = np.array([wafabail for _, wafabail in found] + [False], dtype=bool)[codes]
+    
+    # Special case for "Wafabail" with specific DEBIT amounts (exact match in cents), per row
+    if wafabail.any():
+        contracts = raw_df["DEBIT"][wafabail].map(WAFABAIL_CONTRACTS).to_numpy()
+        known = pd.notna(contracts)
+        tiers[np.flatnonzero(wafabail)[known]] = contracts[known]
+    return pd.Series(tiers, index=raw_df.index)
+
+def classify(raw_df):
+    # Process CPT (first matching rule of rules/cpt_rules.csv)
+    cpt_rules = load_rules("cpt_rules.csv")
+    
+    # Use float type for CPT to support NaN values
+    return cpt_rules.evaluate(raw_df, cents=AMOUNT_COLUMNS).astype(float)
+
+def finalize(raw_df):
+    """Final columns, sorted by date (a datetime64 day, written as text at export)."""
+    # Create final DataFrame with specified columns and formatting
+    result_df = pd.DataFrame({
+        "DATE": to_dates(raw_df["DATE"]).dt.normalize(),
+        "N PIECE": np.nan,
+        "CPT": raw_df["CPT"],
+        "TIERS": raw_df["TIERS"],
+        "LIB": raw_df["LIB"].astype(str),
+        "REF": np.nan,
+        "DEBIT": raw_df["DEBIT"],
+        "CREDIT": raw_df["CREDIT"]
+    })
+    for column in SUGGESTION_COLUMNS:
+        result_df[column] = raw_df[column]
+    
+    # Replace "nan" strings with truly empty cells
+    result_df["CPT"] = result_df["CPT"].replace("nan", np.nan)
+    result_df["TIERS"] = result_df["TIERS"].replace("nan", np.nan)
+    
+    # Sort the dataframe by DATE from old to new
+    return result_df.sort_values(by="DATE", ascending=True)
+
+def classify_rows(raw_df, mapping_index):
+    """TIERS and CPT of each row (after the DGI split)."""
+    with stage("lookup_tiers", len(raw_df)):
+        raw_df["TIERS"] = assign_tiers(raw_df, mapping_index)
+    with stage("cpt_rules", len(raw_df)):
+        raw_df["CPT"] = classify(raw_df)
+    return raw_df[CLASSIFIED_COLUMNS]
+
+def classify_incremental(raw_df, mapping_index, store):
+    """Same as classify_rows, reusing the rows already classified with these rules and mappings."""
+    with stage("fingerprints", len(raw_df)) as record:
+        fields = {column: raw_df[column] for column in FINGERPRINT_COLUMNS}
+        fingerprints = row_fingerprints(fields, load_rules("cpt_rules.csv").version, mapping_index.version)
+        known = store.lookup(fingerprints)
+        new = ~known["known"].to_numpy()
+        record["reused"] = int((~new).sum())
+    
+    # Only new or changed rows go through the lookup and the rules
+    classified = known[CLASSIFIED_COLUMNS].set_axis(raw_df.index)
+    if new.any():
+        new_rows = classify_rows(raw_df[new].copy(), mapping_index)
+        classified.loc[new, "TIERS"] = new_rows["TIERS"].astype(object)
+        classified.loc[new, "CPT"] = new_rows["CPT"].astype(float)
+        store.save(fingerprints[new], new_rows)
+    raw_df["TIERS"] = classified["TIERS"].astype(object).where(classified["TIERS"].notna(), np.nan)
+    raw_df["CPT"] = classified["CPT"].astype(float)
+    return raw_df[CLASSIFIED_COLUMNS]
+
+def transform(raw_df, mapping_index):
+    """Classified statement: one row per movement, sorted by date."""
+    with stage("dgi_split", len(raw_df)):
+        raw_df = prepare(raw_df)
+    
+    # Rows seen in earlier runs keep their TIERS/CPT when the fingerprint store is enabled
+    store = open_store("banque", CLASSIFIED_COLUMNS)
+    if store is None:
+        classify_rows(raw_df, mapping_index)
+    else:
+        classify_incremental(raw_df, mapping_index, store)
+    
+    # Mapping entries close to the RAW_TIER of the rows left without TIERS
+    with stage("suggestions", int(raw_df["TIERS"].isna().sum())):
+        raw_df[SUGGESTION_COLUMNS] = suggest_tiers(raw_df, mapping_index)
+    
+    # Process LIB (concatenate RAW_LIB/NAT/RAW_TIER) - ignoring empty cells
+    with stage("lib", len(raw_df)):
+        raw_df["LIB"] = build_lib(raw_df)
+    with stage("sort", len(raw_df)):
+        return finalize(raw_df)
+
+def build_pivots(result_df):
+    """Détails Comptes (sums per CPT/LIB with totals) and Détails Tiers (rows without TIERS), as rollups.
+    
+    Détails Tiers also has the suggestion columns of each LIB.
+    """
+    cpt_pivot = rollup(result_df, "CPT", "LIB", AMOUNT_COLUMNS)
+    
+    # Only empty TIERS, grouped under a single "TIERS VIDE" label
+    empty_tiers_df = result_df.loc[result_df["TIERS"].isna(), ["LIB", "DEBIT", "CREDIT"] + SUGGESTION_COLUMNS]
+    empty_tiers_df = empty_tiers_df.assign(TIERS="TIERS VIDE")
+    tiers_pivot = rollup(empty_tiers_df, "TIERS", "LIB", AMOUNT_COLUMNS, grand_total=False)
+    
+    # A LIB ends with its RAW_TIER when TIERS is empty, so its rows share the same suggestions
+    suggestions = empty_tiers_df.groupby("LIB")[SUGGESTION_COLUMNS].first()
+    details = tiers_pivot.kinds == DETAIL
+    frame = tiers_pivot.frame
+    for column in SUGGESTION_COLUMNS:
+        frame[column] = np.where(details, frame["LIB"].map(suggestions[column]), None)
+    return cpt_pivot, tiers_pivot
+
+def pivot_row_formats(pivot, total_format, missing_format):
+    # Total rows in grey and bold, rows where CPT is "Vide" in light red (totals win)
+    formats = np.where(pivot.kinds != DETAIL, total_format, None)
+    return np.where(pivot.missing & (pivot.kinds == DETAIL), missing_format, formats)
+
+def write_pivots(workbook, header, cpt_pivot, tiers_pivot):
+    """Détails Comptes and Détails Tiers sheets."""
+    total_format = workbook.add_format({"bg_color": "#E0E0E0", "bold": True})
+    missing_format = workbook.add_format({"bg_color": "#FFCCCC"})
+
+    for sheet_name, pivot in [("Détails Comptes", cpt_pivot), ("Détails Tiers", tiers_pivot)]:
+        # Pivot sheets keep a wide LIB column
+        frame = with_decimals(pivot.frame, AMOUNT_COLUMNS)
+        widths = column_widths(frame)
+        widths[1] = 60
+        row_formats = pivot_row_formats(pivot, total_format, missing_format)
+        write_frame(workbook, sheet_name, frame, header, widths=widths, row_formats=row_formats)
+
+def export_frame(result_df):
+    """Données Transformées as written: dates as dd/mm/yyyy text and amounts with decimals."""
+    frame = with_decimals(result_df[DATA_COLUMNS], AMOUNT_COLUMNS)
+    frame["DATE"] = format_dates(frame["DATE"])
+    return frame
+
+def export_workbook(result_df, cpt_pivot, tiers_pivot):
+    """The downloadable .xlsx with the data and both pivot sheets (only the pivots when result_df is None)."""
+    # Create Excel file for download, streamed row by row by xlsxwriter
+    output = BytesIO()
+    workbook = new_workbook(output)
+    
+    # Headers with color #2596be and white text for better contrast
+    header = header_format(workbook, "#2596BE")
+    
+    # Write the sheets row by row, then let xlsxwriter assemble the file
+    data_rows = 0 if result_df is None else len(result_df)
+    with stage("write", data_rows + len(cpt_pivot.frame) + len(tiers_pivot.frame)):
+        # Write first sheet - main data
+        if result_df is not None:
+            result_df = export_frame(result_df)
+            write_frame(workbook, "Données Transformées", result_df, header, widths=column_widths(result_df))
+        write_pivots(workbook, header, cpt_pivot, tiers_pivot)
+    
+    with stage("save"):
+        workbook.close()
+    return output.getvalue()
+
+def read_and_transform(file, max_rows=None, master=None):
+    with stage("read") as record:
+        raw_df, mapping_index = read_statement(file, max_rows, master)
+        record["rows"] = len(raw_df)
+    return transform(raw_df, mapping_index)
+
+def summarize(result_df, output, data=None):
+    preview = export_frame(result_df.head())
+    return BanqueResult(preview, output, len(result_df), int(result_df["TIERS"].isna().sum()), data)
+
+def table_frame(result_df):
+    """Données Transformées for CSV/Parquet: native dates, amounts with decimals and CPT as integers."""
+    return with_decimals(result_df[DATA_COLUMNS], AMOUNT_COLUMNS).astype({"CPT": "Int64"})
+
+def preview(files, max_rows=PREVIEW_ROWS):
+    """First rows of each (name, file) statement classified like the full run, without pivots or workbook."""
+    if len(files) == 1:
+        result_df = read_and_transform(files[0][1], max_rows)
+    else:
+        result_df = pd.concat(transform_many(files, max_rows), ignore_index=True)
+    return BanqueResult(export_frame(result_df), None, len(result_df), int(result_df["TIERS"].isna().sum()))
+
+def process(file, workbook=True, master=None):
+    """BanqueResult of one statement; without workbook, only the data table is kept (no pivots, no .xlsx).
+    
+    `master` is the mappings used if the statement has no mappings sheet (default: the last compiled).
+    """
+    result_df = read_and_transform(file, master=master)
+    if not workbook:
+        return summarize(result_df, None, table_frame(result_df))
+    with stage("pivots", len(result_df)):
+        cpt_pivot, tiers_pivot = build_pivots(result_df)
+    return summarize(result_df, export_workbook(result_df, cpt_pivot, tiers_pivot))
+
+def account_name(name, used):
+    # Stem of the uploaded file name, made unique within the zip
+    stem = os.path.splitext(os.path.basename(name))[0] or "releve"
+    candidate, n = stem, 2
+    while candidate in used:
+        candidate, n = f"{stem}_{n}", n + 1
+    used.add(candidate)
+    return candidate
+
+def transform_many(files, max_rows=None):
+    """Classified statements of several (name, file) uploads, transformed concurrently, in upload order."""
+    def run(name, file):
+        try:
+            return read_and_transform(file, max_rows)
+        except InvalidFileError as e:
+            raise InvalidFileError(f"{name} : {e}") from e
+    
+    # Threads share the compiled mappings (see mapping_cache) and record into the caller's profile
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(files)))) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, run, name, file) for name, file in files]
+        return [future.result() for future in futures]
+
+def process_many(files, merged=True, workbook=True):
+    """One merged date-sorted workbook, or a zip with one workbook per account, for several statements.
+    
+    The pivots are computed over the combined data in both cases; in the zip
+    they are in a separate synthese.xlsx. Without workbook (merged only), the
+    merged data table is kept instead.
+    """
+    result_dfs = transform_many(files)
+    with stage("merge", sum(len(df) for df in result_dfs)):
+        combined_df = pd.concat(result_dfs, ignore_index=True)
+        combined_df = combined_df.sort_values(by="DATE", kind="stable")
+    if merged and not workbook:
+        return summarize(combined_df, None, table_frame(combined_df))
+    with stage("pivots", len(combined_df)):
+        cpt_pivot, tiers_pivot = build_pivots(combined_df)
+    
+    if merged:
+        return summarize(combined_df, export_workbook(combined_df, cpt_pivot, tiers_pivot))
+    
+    output = BytesIO()
+    used = set()
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as archive:
+        for (name, _), result_df in zip(files, result_dfs):
+            account_pivots = build_pivots(result_df)
+            archive.writestr(f"{account_name(name, used)}_import_awb.xlsx", export_workbook(result_df, *account_pivots))
+        archive.writestr("synthese.xlsx", export_workbook(None, cpt_pivot, tiers_pivot))
+    return summarize(combined_df, output.getvalue())
 
 def app():
     # Page title
     st.title("Banque")
     
-    # File upload
-    uploaded_file = st.file_uploader("Choisissez votre fichier Excel", type=["xlsx"])
+    # File upload (several statements are processed together)
+    uploaded_files = st.file_uploader("Choisissez votre fichier Excel", type=["xlsx"], accept_multiple_files=True)
     
-    if uploaded_file is not None:
+    if uploaded_files:
         try:
-            # Read raw data (Sheet 1) and mappings (Sheet 2)
-            raw_df = pd.read_excel(uploaded_file, sheet_name=0, header=None)
-            mappings_df = pd.read_excel(uploaded_file, sheet_name=1, header=None)  # Assuming no headers in Sheet 2
-    
-            # Validate the number of columns in the raw file
-            if raw_df.shape[1] != 7:
-                st.error(f"8 colonnes attendues dans le fichier, mais {raw_df.shape[1]} trouvées. Veuillez vérifier la structure du fichier.")
-            elif mappings_df.shape[1] < 2:
-                st.error(f"Au moins 2 colonnes attendues dans la feuille de mappage, mais {mappings_df.shape[1]} trouvées. Veuillez vérifier la structure du fichier.")
+            merged = True
+            if len(uploaded_files) > 1:
+                merged = st.radio(
+                    "Sortie", ["Un classeur fusionné", "Un fichier par compte (zip)"], horizontal=True
+                ) == "Un classeur fusionné"
+    
+            # Excel workbook with the pivots, or the data table alone as CSV/Parquet (merged output only)
+            target, csv_options = choose_target("BANQUE") if merged else (XLSX, None)
+            workbook = target == XLSX
+    
+            # Reruns (e.g. clicking the download button, polling the job) reuse the result of the same
+            # uploads; each upload is hashed and checked once, the bytes are read only by the run itself
+            open_files = lambda: [(uploaded_file.name, BytesIO(uploaded_file.getvalue())) for uploaded_file in uploaded_files]
+            # Uploads without a mappings sheet are classified with the current master list
+            has_mappings = all(per_upload(uploaded_file, "mappings", lambda data: sheet_digest(BytesIO(data), 1) is not None)
+                               for uploaded_file in uploaded_files)
+            versions = (load_rules("cpt_rules.csv").version, "" if has_mappings else MAPPINGS.latest_version())
+            if len(uploaded_files) == 1:
+                uploads = upload_digest(uploaded_files[0])
+                key = content_key("BANQUE", uploads, workbook, *versions)
+                compute = lambda: process(open_files()[0][1], workbook)
             else:
-                # Assign column names to raw data (7 columns)
-                raw_df.columns = [
-                    "DATE", "RAW_LIB", "RAW_TIER", "RAW_REF", 
-                    "DEBIT", "CREDIT", "CA"
-                ]
-                
-                # Convert numeric columns to proper numeric types from the beginning
-                raw_df["DEBIT"] = pd.to_numeric(raw_df["DEBIT"], errors='coerce').fillna(0)
-                raw_df["CREDIT"] = pd.to_numeric(raw_df["CREDIT"], errors='coerce').fillna(0)
-                
-                # Create a copy of rows to split - specifically for DGI with DEBIT=734
-                rows_to_split = raw_df[(raw_df["RAW_TIER"].astype(str).str.contains("dgi", case=False)) & 
-                                      (raw_df["DEBIT"] == 734)].copy()
-
-                if not rows_to_split.empty:
-                    # Create two new rows for each row to split
-                    split_rows = []
-                    indices_to_drop = []
-                    
-                    for idx, row in rows_to_split.iterrows():
-                        indices_to_drop.append(idx)
-                        
-                        # First row - RETENU MEDECIN
-                        medecin_row = row.copy()
-                        medecin_row["RAW_REF"] = "RETENU MEDECIN"
-                        medecin_row["DEBIT"] = 400
-                        
-                        # Second row - RETENU AVOCAT
-                        avocat_row = row.copy()
-                        avocat_row["RAW_REF"] = "RETENU AVOCAT"
-                        avocat_row["DEBIT"] = 334
-                        
-                        split_rows.append(medecin_row)
-                        split_rows.append(avocat_row)
-                    
-                    # Remove the original rows and add the new rows
-                    raw_df = raw_df.drop(indices_to_drop)
-                    
-                    # Add the new rows
-                    if split_rows:
-                        split_df = pd.DataFrame(split_rows)
-                        raw_df = pd.concat([raw_df, split_df], ignore_index=True)
-    
-                # Process TIERS (lookup RAW_TIER as wildcard in mappings sheet)
-                def lookup_tiers(row):
-                    raw_tier = row["RAW_TIER"]
-                    debit = row["DEBIT"]
-                    
-                    if pd.isna(raw_tier):
-                        return np.nan
-                    
-                    # Special case for "abdelatif saidou(medecin)"
-                    if isinstance(raw_tier, str) and "saidou" in str(raw_tier).lower() and "medecin" in str(raw_tier).lower():
-                        return "SAIDOU ABDELLATIPH"
-                    
-                    # Special case for "Wafabail" with specific DEBIT amounts
-                    if isinstance(raw_tier, str) and "wafabail" in str(raw_tier).lower():
-                        # Round to 2 decimal places to ensure exact matching
-                        debit_rounded = round(debit, 2)
-                        
-                        if debit_rounded == 28780.38:
-                            return "WAFABAIL CONTRAT S0514740 SMARTEC"
-                        elif debit_rounded == 13790.77:
-                            return "WAFABAIL CONTRAT S0623820 FORGEZ DE BASAS"
-                        elif debit_rounded == 10204.08:
-                            return "WAFABAIL CONTRAT S0514750 MAP MAGHREB"
-                        elif debit_rounded == 20408.17 or debit_rounded == 20139.84:
-                            return "WAFABAIL CONTRAT S0514770 MAP MAGHREB"
-                    
-                    # Find rows in mappings_df where the pattern matches RAW_TIER (wildcard)
-                    matches = mappings_df[mappings_df[0].astype(str).str.contains(str(raw_tier), case=False, na=False)]
-                    if not matches.empty:
-                        return matches.iloc[0, 1]  # Return the first matching value from column 1
-                    return np.nan
-    
-                # Apply the lookup_tiers function to each row
-                raw_df["TIERS"] = raw_df.apply(lookup_tiers, axis=1)
-    
-                # Process CPT (apply conditions)
-                # Ensure all conditions are boolean arrays
-                conditions = [
-                    # Rule 0: Column CA equals 1
-                    (raw_df["CA"] == 1),
-                    # Rule 1: RAW_TIER starts with "FRUL" (case-insensitive)
-                    raw_df["RAW_TIER"].astype(str).str.upper().str.startswith("FRUL", na=False),
-                    # Rule 2: RAW_FILTER starts with "SALAIRE" or NAT == "PAIE"
-                    (raw_df["RAW_REF"].astype(str).str.upper().str.startswith("CONGÉ", na=False)) | (raw_df["RAW_REF"] == "PAIE"),
-                    # Rule 3: RAW_TIER == "CNSS" or NAT == "COTIS"
-                    (raw_df["RAW_TIER"].astype(str).str.upper() == "CNSS") | (raw_df["RAW_REF"] == "COTIS"),
-                    # Rule 4: RAW_REF == FRAIS
-                    (raw_df["RAW_REF"] == "FRAIS") | raw_df["RAW_LIB"].astype(str).str.upper().str.startswith("FRAIS", na=False),
-                    # Rule 5: RAW_REF equals PERTE
-                    (raw_df["RAW_REF"] == "PERTE"),
-                    # Rule 5.1: RAW_REF equals GAIN
-                    (raw_df["RAW_REF"] == "GAIN"),
-                    # Rule 6: NAT == "FELAH" or TIERS contains specified strings
-                    (raw_df["RAW_REF"] == "FELAH") | 
-                    raw_df["TIERS"].astype(str).str.contains("|".join([
-                        "AJYAD", "ASWAK", "ATTIJARI", "AUTOROUTE", "BIOCI", "BOIS", "BOUNMER", 
-                        "BRICO", "CABINET", "CARREF", "consilia", "conseil", "da graph", "deco new", 
-                        "durofloor", "electroplanet", "environnement", "FOURNI", "BAZAS", 
-                        "globus", "hamri tissus", "ideal", "inwi", "incendie", "khadamat", "kitea", 
-                        "KPA", "lab", "lvs", "MAMDA", "MARAHIL", "marjan", "ministre", "MOGES", "MUST", "ORANGE", 
-                        "PLANEX", "pneumatique", "PRINT", "REDAL", "relanc", "REFRI", "SANITAIRE", 
-                        "secola", "SMURF", "smpce", "SOLUTIONS", "STARDEC", "TEMARA", "trois", "WAFABAIL", 
-                        "intra", "abcr", "boulon", "bmj", "Khadamat", "TRANS", "AFROUKH", "onssa", "ZIMBA", 
-                        "STORES", "GOLD", "COMPLEX", "LEGNO", "TISSUS", "DAKAR", "PROJET", "D.A"
-                    ]), case=False, na=False),
-                    # Rule 7: RAW_REF == "IR"
-                    (raw_df["RAW_REF"] == "IR"),
-                    # Rule 8: RAW_REF == "RETENU MEDECIN"
-                    (raw_df["RAW_REF"] == "RETENU MEDECIN"),
-                    # Rule 9: RAW_REF == "RETENU AVOCAT"
-                    (raw_df["RAW_REF"] == "RETENU AVOCAT"),
-                    # Rule 10: RAW_TIER contains "SAIDOU"
-                    (raw_df["RAW_TIER"].astype(str).str.upper().str.contains("SAIDOU", na=False)),
-                    # Rule 11: RAW_TIER contains "vignette"
-                    (raw_df["RAW_TIER"].astype(str).str.upper().str.contains("VIGNETTE", na=False)),
-                    # Rule 12: RAW_TIER contains "caisse"
-                    (raw_df["RAW_TIER"].astype(str).str.upper().str.contains("CAISSE", na=False))
-                ]
-    
-                choices = [
-                    3497000000,  # Rule 0
-                    3421000000,  # Rule 1
-                    4432000000,  # Rule 2
-                    4441000000,  # Rule 3
-                    6147300000,  # Rule 4
-                    6331000000,  # Rule 5
-                    7331000000,  # Rule 5.1
-                    4411000000,  # Rule 6
-                    4452500000,  # Rule 7
-                    4458110100,  # Rule 8
-                    4458110200,  # Rule 9
-                    4411000000,  # Rule 10
-                    4452110000,  # Rule 11
-                    5115000000   # Rule 12
-                ]
-    
-                # Use float type for CPT to support NaN values
-                raw_df["CPT"] = np.select(conditions, choices, default=np.nan).astype(float)
-    
-                # Process LIB (concatenate RAW_LIB/NAT/RAW_TIER) - ignoring empty cells
-                raw_df["LIB"] = raw_df.apply(
-                    lambda row: " / ".join(
-                        filter(None, [
-                            str(row["RAW_LIB"]).strip() if pd.notna(row["RAW_LIB"]) else None,
-                            str(row["RAW_REF"]).strip() if pd.notna(row["RAW_REF"]) else None,
-                            str(row["TIERS"]).strip() if pd.notna(row["TIERS"]) else (
-                                str(row["RAW_TIER"]).strip() if pd.notna(row["RAW_TIER"]) else None
-                            )
-                        ])
-                    ),
-                    axis=1
+                uploads = "\n".join(f"{uploaded_file.name}:{upload_digest(uploaded_file)}" for uploaded_file in uploaded_files).encode()
+                key = content_key("BANQUE", uploads, merged, workbook, *versions)
+                compute = lambda: process_many(open_files(), merged, workbook)
+    
+            # First rows only, to catch a wrong file or sheet order before the full run
+            if st.session_state.get("BANQUE_confirmed") != key:
+                sample = RESULTS.get_or_compute(
+                    content_key("BANQUE_APERCU", uploads, *versions),
+                    lambda: preview(open_files()),
                 )
-                
-                # Create final DataFrame with specified columns and formatting
-                result_df = pd.DataFrame({
-                    "DATE": pd.to_datetime(raw_df["DATE"]).dt.strftime("%d/%m/%Y"),
-                    "N PIECE": np.nan,
-                    "CPT": raw_df["CPT"],
-                    "TIERS": raw_df["TIERS"],
-                    "LIB": raw_df["LIB"].astype(str),
-                    "REF": np.nan,
-                    "DEBIT": raw_df["DEBIT"].round(2),
-                    "CREDIT": raw_df["CREDIT"].round(2)
-                })
-    
-                # Replace "nan" strings with truly empty cells
-                result_df["CPT"] = result_df["CPT"].replace("nan", np.nan)
-                result_df["TIERS"] = result_df["TIERS"].replace("nan", np.nan)
-                
-                # Sort the dataframe by DATE from old to new
-                # First convert back to datetime for proper sorting
-                result_df["DATE_SORT"] = pd.to_datetime(result_df["DATE"], format="%d/%m/%Y")
-                result_df = result_df.sort_values(by="DATE_SORT", ascending=True)
-                result_df = result_df.drop(columns=["DATE_SORT"])  # Remove the sorting column
-    
-                # Show preview of the result
                 st.write("### Aperçu des Données Transformées")
-                st.dataframe(result_df.head())
-                
-                ###############################################
-                # PIVOT FOR CPT DETAILS SHEET
-                ###############################################
-                # Create a flattened version of the data for the pivot table
-                result_df_for_pivot = result_df.copy()
-                
-                # Ensure DEBIT and CREDIT are numeric values
-                result_df_for_pivot["DEBIT"] = pd.to_numeric(result_df_for_pivot["DEBIT"], errors='coerce').fillna(0)
-                result_df_for_pivot["CREDIT"] = pd.to_numeric(result_df_for_pivot["CREDIT"], errors='coerce').fillna(0)
-                
-                # Replace NaN in CPT with "Vide" string
-                result_df_for_pivot["CPT"] = result_df_for_pivot["CPT"].fillna("Vide")
-                
-                # Group by CPT and LIB to get sums
-                grouped_data = result_df_for_pivot.groupby(["CPT", "LIB"]).agg({
-                    "DEBIT": "sum",
-                    "CREDIT": "sum"
-                }).reset_index()
-                
-                # Add CPT subtotals
-                cpt_totals = result_df_for_pivot.groupby("CPT").agg({
-                    "DEBIT": "sum",
-                    "CREDIT": "sum"
-                }).reset_index()
-                
-                # Add "Total" to LIB column for the CPT subtotals
-                cpt_totals["LIB"] = "Total"
-                
-                # Add grand total
-                grand_total = pd.DataFrame({
-                    "CPT": ["Total"],
-                    "LIB": [""],
-                    "DEBIT": [result_df_for_pivot["DEBIT"].sum()],
-                    "CREDIT": [result_df_for_pivot["CREDIT"].sum()]
-                })
-                
-                # Combine all data - First grouped data, then CPT totals, then grand total
-                combined_data = pd.concat([grouped_data, cpt_totals, grand_total], ignore_index=True)
-                
-                # Sort the dataframe - this keeps the rows with the same CPT together
-                # and ensures the "Vide" rows are together as well
-                combined_data = combined_data.sort_values(by=["CPT", "LIB"])
-                
-                # Move Total CPT to the end
-                total_row = combined_data[combined_data["CPT"] == "Total"]
-                combined_data = combined_data[combined_data["CPT"] != "Total"]
-                combined_data = pd.concat([combined_data, total_row], ignore_index=True)
-                
-                ###############################################
-                # PIVOT FOR EMPTY TIERS SHEET
-                ###############################################
-                # Create a copy for the TIERS pivot
-                tiers_df = result_df.copy()
-                
-                # Ensure DEBIT and CREDIT are numeric
-                tiers_df["DEBIT"] = pd.to_numeric(tiers_df["DEBIT"], errors='coerce').fillna(0)
-                tiers_df["CREDIT"] = pd.to_numeric(tiers_df["CREDIT"], errors='coerce').fillna(0)
-                
-                # Filter for empty TIERS
-                empty_tiers_df = tiers_df[tiers_df["TIERS"].isna()]
-                
-                # Replace NaN in TIERS with "Vide" for grouping
-                empty_tiers_df["TIERS"] = "TIERS VIDE"
-                
-                # Group by TIERS and LIB to get sums
-                tiers_grouped = empty_tiers_df.groupby(["TIERS", "LIB"]).agg({
-                    "DEBIT": "sum",
-                    "CREDIT": "sum"
-                }).reset_index()
-                
-                # Add TIERS subtotal
-                tiers_total = empty_tiers_df.groupby("TIERS").agg({
-                    "DEBIT": "sum",
-                    "CREDIT": "sum"
-                }).reset_index()
-                tiers_total["LIB"] = "Total"
-                
-                # Combine the data
-                tiers_combined = pd.concat([tiers_grouped, tiers_total], ignore_index=True)
-                
-                # Sort to ensure total appears at the end
-                tiers_combined = tiers_combined.sort_values(by=["TIERS", "LIB"])
-                tiers_combined_total = tiers_combined[tiers_combined["LIB"] == "Total"]
-                tiers_combined = tiers_combined[tiers_combined["LIB"] != "Total"]
-                tiers_combined = pd.concat([tiers_combined, tiers_combined_total], ignore_index=True)
-                
-                ###############################################
-                # CREATE EXCEL FILE WITH ALL SHEETS
-                ###############################################
-                # Create Excel file for download
-                output = BytesIO()
-                with pd.ExcelWriter(output, engine="openpyxl") as writer:
-                    # Write first sheet - main data
-                    result_df.to_excel(writer, index=False, sheet_name="Données Transformées", na_rep="")
-                    
-                    # Write second sheet - CPT pivot data
-                    combined_data.to_excel(writer, sheet_name="Détails Comptes", index=False)
-                    
-                    # Write third sheet - TIERS pivot data (only empty TIERS)
-                    tiers_combined.to_excel(writer, sheet_name="Détails Tiers", index=False)
-                    
-                    # Get the worksheets to apply formatting
-                    workbook = writer.book
-                    main_sheet = writer.sheets["Données Transformées"]
-                    pivot_sheet = writer.sheets["Détails Comptes"]
-                    tiers_sheet = writer.sheets["Détails Tiers"]
-                    
-                    ###############################################
-                    # FORMAT MAIN SHEET
-                    ###############################################
-                    # Auto-fit columns
-                    for col_num, column in enumerate(result_df.columns, 1):
-                        column_width = max(
-                            result_df[column].astype(str).map(len).max(),  # Width of the data
-                            len(str(column))  # Width of the header
-                        ) + 2  # Add a little extra space
-                        main_sheet.column_dimensions[get_column_letter(col_num)].width = column_width
-                    
-                    # Format headers with color #2596be
-                    for cell in main_sheet[1]:
-                        cell.fill = PatternFill(start_color="2596BE", end_color="2596BE", fill_type="solid")
-                        cell.font = Font(bold=True, color="FFFFFF")  # White text for better contrast
-                    
-                    ###############################################
-                    # FORMAT CPT PIVOT SHEET
-                    ###############################################
-                    # Format headers with the same color
-                    for cell in pivot_sheet[1]:
-                        cell.fill = PatternFill(start_color="2596BE", end_color="2596BE", fill_type="solid")
-                        cell.font = Font(bold=True, color="FFFFFF")
-                    
-                    # Auto-fit columns for pivot table
-                    for col_num, column in enumerate(combined_data.columns, 1):
-                        if col_num == 2:  # LIB column
-                            pivot_sheet.column_dimensions[get_column_letter(col_num)].width = 60
-                        else:
-                            column_width = max(
-                                combined_data[column].astype(str).map(len).max(),
-                                len(str(column))
-                            ) + 2
-                            pivot_sheet.column_dimensions[get_column_letter(col_num)].width = column_width
-                    
-                    # Define color fills
-                    light_red_fill = PatternFill(start_color="FFCCCC", end_color="FFCCCC", fill_type="solid")
-                    total_fill = PatternFill(start_color="E0E0E0", end_color="E0E0E0", fill_type="solid")
-                    
-                    # Apply formatting to pivot sheet rows
-                    for row_idx in range(2, pivot_sheet.max_row + 1):  # Start from row 2 (after header)
-                        cpt_value = pivot_sheet.cell(row=row_idx, column=1).value
-                        lib_value = pivot_sheet.cell(row=row_idx, column=2).value
-                        
-                        # Color all rows where CPT is "Vide" with light red
-                        if cpt_value == "Vide":
-                            for col_idx in range(1, pivot_sheet.max_column + 1):
-                                pivot_sheet.cell(row=row_idx, column=col_idx).fill = light_red_fill
-                        
-                        # Format total rows
-                        if (cpt_value == "Total") or (lib_value == "Total"):
-                            for col_idx in range(1, pivot_sheet.max_column + 1):
-                                cell = pivot_sheet.cell(row=row_idx, column=col_idx)
-                                cell.fill = total_fill
-                                cell.font = Font(bold=True)
-                    
-                    ###############################################
-                    # FORMAT TIERS PIVOT SHEET
-                    ###############################################
-                    # Format headers with the same color
-                    for cell in tiers_sheet[1]:
-                        cell.fill = PatternFill(start_color="2596BE", end_color="2596BE", fill_type="solid")
-                        cell.font = Font(bold=True, color="FFFFFF")
-                    
-                    # Auto-fit columns for TIERS pivot table
-                    for col_num, column in enumerate(tiers_combined.columns, 1):
-                        if col_num == 2:  # LIB column
-                            tiers_sheet.column_dimensions[get_column_letter(col_num)].width = 60
-                        else:
-                            column_width = max(
-                                tiers_combined[column].astype(str).map(len).max(),
-                                len(str(column))
-                            ) + 2
-                            tiers_sheet.column_dimensions[get_column_letter(col_num)].width = column_width
-                    
-                    # Apply formatting to TIERS pivot sheet rows
-                    for row_idx in range(2, tiers_sheet.max_row + 1):  # Start from row 2 (after header)
-                        lib_value = tiers_sheet.cell(row=row_idx, column=2).value
-                        
-                        # Format total rows
-                        if lib_value == "Total":
-                            for col_idx in range(1, tiers_sheet.max_column + 1):
-                                cell = tiers_sheet.cell(row=row_idx, column=col_idx)
-                                cell.fill = total_fill
-                                cell.font = Font(bold=True)
-                
-                output.seek(0)
-                st.success("Votre fichier est prêt !")
+                st.caption(f"{PREVIEW_ROWS} premières lignes de chaque relevé : {sample.unmapped} sur {sample.rows} sans TIERS.")
+                st.dataframe(sample.preview)
+                if not st.button("Lancer le traitement complet"):
+                    return
+                st.session_state["BANQUE_confirmed"] = key
+    
+            # Run in the background; the page polls the job until the workbook is ready
+            finished = run_job("BANQUE", key, compute, STAGES)
+            if finished is None:
+                return
+            result, profile = finished
+    
+            # Show preview of the result
+            st.write("### Aperçu des Données Transformées")
+            st.dataframe(result.preview)
+            show_profile(profile)
+    
+            st.success("Votre fichier est prêt !")
+            if not workbook:
+                download_table(result.data, "import_awb", target, csv_options, EXPORT_FORMAT)
+            elif merged:
                 st.download_button(
                     label="Télécharger le fichier",
-                    data=output,
+                    data=result.output,
                     file_name="import_awb.xlsx",
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                 )
-        
+            else:
+                st.download_button(
+                    label="Télécharger les fichiers",
+                    data=result.output,
+                    file_name="import_awb.zip",
+                    mime="application/zip"
+                )
+
+        except (InvalidFileError, ExportError) as e:
+            st.error(str(e))
         except Exception as e:
             st.error(f"Une erreur s'est produite : {e}")
             # For debugging
             st.error(f"Détails: {str(e)}")
             import traceback
             st.error(traceback.format_exc())
-            
+    
 if __name__ == "__main__":
     app()
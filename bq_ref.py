@@ -2,11 +2,167 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 from io import BytesIO
-from openpyxl import Workbook, load_workbook
-from openpyxl.utils.dataframe import dataframe_to_rows
-from openpyxl.worksheet.datavalidation import DataValidation
-from openpyxl.styles import Alignment, PatternFill, Font
-from openpyxl.utils import get_column_letter
+from collections import namedtuple
+from amounts import to_cents
+from cache import content_key, upload_digest
+from export import new_workbook, column_widths, row_ranges, unique_sheet_name, write_frame
+from fingerprints import open_store, row_fingerprints
+from ingest import InvalidFileError, read_workbook
+from jobs import run_job
+from passthrough import PassthroughError, copy_sheet
+from rules import load_rules
+from timing import show_profile, stage
+
+# Workbook to download, number of rows and rows left without REF
+ReferenceResult = namedtuple("ReferenceResult", ["output", "rows", "unmapped"])
+
+# Stages of a run in order, for the progress bar of background jobs
+STAGES = ["read", "classify", "write", "save", "passthrough"]
+
+# Display of the dates, as openpyxl writes datetimes by default
+DATE_FORMAT = "yyyy-mm-dd h:mm:ss"
+DATE_WIDTH = len("2024-01-31 00:00:00")
+
+# Choices of the REF dropdown
+REF_OPTIONS = ["FELAH", "FAC", "FRAIS", "REMB", "PAIE", "COTIS", "IR", "RETENU MEDECIN", "RETENU AVOCAT"]
+
+# Inputs of the REF rules that are fingerprinted to reuse earlier results
+FINGERPRINT_COLUMNS = ["DATE", "RAW_LIB", "RAW_TIER", "RAW_REF", "DEBIT", "CREDIT"]
+
+def rule_refs(df):
+    """REF given by the first matching rule of rules/ref_rules.csv, empty for dropdown."""
+    # DEBIT and CREDIT in cents, 0 if empty
+    debit = to_cents(df["DEBIT"])
+    credit = to_cents(df["CREDIT"])
+    
+    ref_rules = load_rules("ref_rules.csv")
+    return ref_rules.evaluate({
+        "RAW_TIER": df["RAW_TIER"],
+        "RAW_LIB": df["RAW_LIB"],
+        "RAW_REF": df["RAW_REF"],
+        "DEBIT": debit,
+        "SOLDE": debit - credit,
+    }, default="", cents=["DEBIT", "SOLDE"])
+
+def rule_refs_incremental(df, store):
+    """Same as rule_refs, reusing the rows already classified with these rules."""
+    fields = {column: df[column] for column in FINGERPRINT_COLUMNS}
+    fields["DEBIT"] = to_cents(fields["DEBIT"])
+    fields["CREDIT"] = to_cents(fields["CREDIT"])
+    fingerprints = row_fingerprints(fields, load_rules("ref_rules.csv").version)
+    known = store.lookup(fingerprints)
+    new = ~known["known"].to_numpy()
+    
+    refs = known["REF"].to_numpy(dtype=object)
+    if new.any():
+        refs[new] = rule_refs(df[new])
+        store.save(fingerprints[new], pd.DataFrame({"REF": refs[new]}))
+    return refs
+
+def classify_refs(df, original_refs):
+    """Return the REF column for df (lowercased RAW_* columns), keeping non-empty original_refs."""
+    # Rows seen in earlier runs keep their REF when the fingerprint store is enabled
+    store = open_store("reference", ["REF"])
+    auto_refs = rule_refs(df) if store is None else rule_refs_incremental(df, store)
+    
+    # Only auto-fill if the original cell was empty
+    return np.where(original_refs == "", auto_refs, original_refs)
+
+def read_reference(file):
+    """Statement (sheet 1) with lowercased RAW_* columns and its original REF values."""
+    # Read and prepare data
+    # Only the first sheet is parsed, the second one is copied as is (see build_workbook)
+    workbook = read_workbook(file, sheets=[0])
+    df = workbook.frames[0]
+    
+    if df.shape[1] < 7:
+        raise InvalidFileError("Le fichier doit contenir au moins 7 colonnes")
+        
+    # Keep original values from column 5 (index 4) which will become RAW_REF
+    original_ref_values = df.iloc[:, 4].values
+    df.columns = ["DATE", "DROP", "RAW_LIB", "RAW_TIER", "RAW_REF", "DEBIT", "CREDIT"]
+    df = df.drop(columns="DROP")
+    
+    # Convert to lowercase for matching and replace 'nan' with empty string
+    # Force conversion to string type first to handle NaN/float values
+    df["RAW_TIER"] = df["RAW_TIER"].fillna("").astype(str).str.lower()
+    df["RAW_LIB"] = df["RAW_LIB"].fillna("").astype(str).str.lower()
+    df["RAW_REF"] = df["RAW_REF"].fillna("").astype(str).str.lower()
+    
+    original_refs = pd.Series(original_ref_values, index=df.index, dtype=object).fillna("").astype(str).str.strip()
+    return df, original_refs
+
+def write_processed(df, refs, original_refs, passthrough=None):
+    """The Processed sheet with REF dropdowns, and the second sheet of `passthrough` (WorkbookData) by value."""
+    # Create Excel workbook, streamed row by row by xlsxwriter
+    output = BytesIO()
+    wb = new_workbook(output)
+    date_format = wb.add_format({"num_format": DATE_FORMAT})
+    
+    processed = pd.DataFrame({
+        "DATE": df["DATE"],
+        "RAW_LIB": df["RAW_LIB"],
+        "RAW_TIER": df["RAW_TIER"],
+        "REF": refs,
+        "DEBIT": df["DEBIT"],
+        "CREDIT": df["CREDIT"],
+    })
+    
+    # Add dropdown to empty cells or cells that had original values from dropdown options
+    dropdown = (processed["REF"] == "") | (processed["REF"].isin(REF_OPTIONS) & (processed["REF"] == original_refs.to_numpy()))
+    
+    with stage("write", len(df)):
+        # Rows without header, columns sized from the longest value of each
+        widths = column_widths(processed)
+        widths[0] = max(widths[0], DATE_WIDTH + 2)  # Dates are shown with their time
+        widths = [width * 1.2 for width in widths]
+        ws = write_frame(wb, "Processed", processed, column_formats={"DATE": date_format}, widths=widths, write_header=False)
+    
+        # One validation over all dropdown cells, as runs of rows (D column is REF)
+        ranges = row_ranges(dropdown, "D")
+        if ranges:
+            ws.data_validation(0, 3, 0, 3, {
+                "validate": "list",
+                "source": REF_OPTIONS,
+                "ignore_blank": True,
+                "show_error": False,
+                "multi_range": ranges,
+            })
+    
+        # Add the second sheet from original file if it exists
+        if passthrough is not None and 1 in passthrough.frames:
+            second_sheet = passthrough.frames[1]
+            date_columns = {column: date_format for column in second_sheet.columns
+                            if pd.api.types.is_datetime64_any_dtype(second_sheet[column])}
+            name = unique_sheet_name(passthrough.sheet_names[1], ["Processed"])
+            write_frame(wb, name, second_sheet, column_formats=date_columns, write_header=False)
+    
+    with stage("save"):
+        wb.close()
+    return output.getvalue()
+
+def build_workbook(df, refs, original_refs, file):
+    """The downloadable .xlsx: processed rows with REF dropdowns, then the original second sheet."""
+    output = write_processed(df, refs, original_refs)
+    
+    # The second sheet is copied from the upload package with its formatting, without parsing it
+    with stage("passthrough"):
+        try:
+            return copy_sheet(output, file, 1)
+        except PassthroughError:
+            # Unusual package layout: copy the values instead
+            return write_processed(df, refs, original_refs, read_workbook(file, sheets=[1]))
+
+def process(file):
+    with stage("read") as record:
+        df, original_refs = read_reference(file)
+        record["rows"] = len(df)
+    
+    # Classify all rows at once, then write them out
+    with stage("classify", len(df)):
+        refs = classify_refs(df, original_refs)
+    output = build_workbook(df, refs, original_refs, file)
+    return ReferenceResult(output, len(df), int((refs == "").sum()))
 
 def app():
     st.title("Reference Banque")
@@ -15,149 +171,25 @@ def app():
 
     if uploaded_file:
         try:
-            # Read and prepare data
-            # Read all sheets but we'll only process the first one
-            xls = pd.ExcelFile(uploaded_file)
-            df = pd.read_excel(xls, sheet_name=0, header=None)
-            
-            if df.shape[1] < 7:
-                st.error("Le fichier doit contenir au moins 7 colonnes")
+            # Reruns (e.g. clicking the download button, polling the job) reuse the result of the same upload
+            key = content_key("REFERENCE", upload_digest(uploaded_file), load_rules("ref_rules.csv").version)
+            # Run in the background; the page polls the job until the workbook is ready
+            finished = run_job("REFERENCE", key, lambda: process(BytesIO(uploaded_file.getvalue())), STAGES)
+            if finished is None:
                 return
-                
-            # Keep original values from column 5 (index 4) which will become RAW_REF
-            original_ref_values = df.iloc[:, 4].values
-            df.columns = ["DATE", "DROP", "RAW_LIB", "RAW_TIER", "RAW_REF", "DEBIT", "CREDIT"]
-            df = df.drop(columns="DROP")
-            
-            # Convert to lowercase for matching and replace 'nan' with empty string
-            # Force conversion to string type first to handle NaN/float values
-            df["RAW_TIER"] = df["RAW_TIER"].fillna("").astype(str).str.lower()
-            df["RAW_LIB"] = df["RAW_LIB"].fillna("").astype(str).str.lower()
-            df["RAW_REF"] = df["RAW_REF"].fillna("").astype(str).str.lower()
-            
-            # Create Excel workbook
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Processed"  # Rename the first sheet
-            
-            # Define dropdown options
-            options = ["FELAH", "FAC", "FRAIS", "REMB", "PAIE", "COTIS", "IR", "RETENU MEDECIN", "RETENU AVOCAT"]
-            
-            # Create data validation
-            dv = DataValidation(type="list", formula1=f'"{",".join(options)}"', allow_blank=True)
-            ws.add_data_validation(dv)
-                
-            # Process each row with explicit row indexing to avoid blank rows
-            row_idx = 1  # Start from row 2 (after headers)
-            for idx, row in df.iterrows():
-                # Convert to string and clean
-                if pd.isna(original_ref_values[idx]):
-                    original_ref = ""
-                else:
-                    original_ref = str(original_ref_values[idx]).strip()
-                
-                # Only auto-fill if the original cell was empty
-                if original_ref == "":
-                    # Safe string checking
-                    raw_tier = str(row["RAW_TIER"]).lower() if pd.notna(row["RAW_TIER"]) else ""
-                    raw_lib = str(row["RAW_LIB"]).lower() if pd.notna(row["RAW_LIB"]) else ""
-                    raw_ref = str(row["RAW_REF"]).lower() if pd.notna(row["RAW_REF"]) else ""
-                    
-                    # Convert DEBIT and CREDIT to numeric values, defaulting to 0 if NaN
-                    debit_val = float(row["DEBIT"]) if pd.notna(row["DEBIT"]) else 0
-                    credit_val = float(row["CREDIT"]) if pd.notna(row["CREDIT"]) else 0
-                    
-                    if any(name in raw_tier for name in ["hamza", "youssef", "abdellah", "yousef", "rachid", "majdoubi", "touhami", "bikri", 
-                                "bouzidi", "brahim", "derouach", "hatta", "benda", "khalid", "amine", "hamid", 
-                                "mohammed", "mohamed", "sliman", "benbo", "dkhail", "charrad", "bouzid", "lehcen", 
-                                "acha", "akil", "benz", "hassan", "hadri", "kharmo", "jilali", "houcin", "fellaha", 
-                                "miloud", "asmaa", "bouchta", "ahmed", "afroukh", "znagui"]):
-                        ref = "FELAH"
-                    elif any(kw in raw_tier for kw in ["orange", "mamda", "onssa", "aswak", "brico", "carref", "wafabail", "cabinet", 
-                                "trans", "redal", "refri", "secola", "dakar", "attijari", "temara", "kpa", "easy", 
-                                "ajyad", "bioci", "must", "saidou", "bounmer", "pharmaci", "boutiq", "print", "moges", "fourni", "bois", 
-                                "planex", "smurf", "asswak", "autor", "omnium", "dakkar", "idealalu", 
-                                "deco new", "abcr", "azrou complexes", "da graph", "durofloor", "tissus", "electroplanet",
-                                "forges de bazas", "globus", "environnement", "lab", "intra", "inwi",
-                                "khadamat", "kitea", "trois", "lvs", "marjan", "ministre", "muneris", 
-                                "consilia", "ola", "conseil", "pneumatique", "incendie", "sanitaire", 
-                                "smpce", "star dec", "boulon"]):
-                        ref = "FAC"
-                    elif any(kw in raw_lib or kw in raw_tier for kw in ["frais", "commis", "pmeplus"]):
-                        ref = "FRAIS"
-                    elif raw_tier == "cnss":
-                        ref = "COTIS"
-                    elif "salaire" in raw_tier:
-                        ref = "PAIE"
-                    elif "cong" in raw_ref:
-                        ref = "PAIE"
-                    elif "ettoumy" in raw_tier:
-                        ref = "PAIE"
-                    elif "relanc" in raw_tier:
-                        ref = "REMB"
-                    elif raw_tier == "dgi" and debit_val > 50000:
-                        ref = "IR"
-                    elif "change" in raw_lib:
-                        if debit_val > credit_val:
-                            ref = "PERTE"
-                        else:
-                            ref = "GAIN"
-                    else:
-                        ref = ""  # Empty for dropdown
-                else:
-                    ref = original_ref  # Keep original value
-                
-                # Write row to Excel with explicit row index to avoid blank rows
-                ws.cell(row=row_idx, column=1).value = row["DATE"]
-                ws.cell(row=row_idx, column=2).value = row["RAW_LIB"]
-                ws.cell(row=row_idx, column=3).value = row["RAW_TIER"]
-                ws.cell(row=row_idx, column=4).value = ref
-                ws.cell(row=row_idx, column=5).value = row["DEBIT"]
-                ws.cell(row=row_idx, column=6).value = row["CREDIT"]
-                
-                # Add dropdown to empty cells or cells that had original values from dropdown options
-                if ref == "" or (ref in options and ref == original_ref):
-                    dv.add(ws[f"D{row_idx}"])  # D column is REF
-                
-                row_idx += 1  # Increment row counter
-            
-            # Auto-fit columns
-            for column in ws.columns:
-                max_length = 0
-                column_letter = get_column_letter(column[0].column)
-                
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                
-                adjusted_width = (max_length + 2) * 1.2
-                ws.column_dimensions[column_letter].width = adjusted_width
-            
-            # Add the second sheet from original file if it exists
-            if len(xls.sheet_names) > 1:
-                original_wb = load_workbook(uploaded_file)
-                original_second_sheet = original_wb[xls.sheet_names[1]]
-                new_sheet = wb.create_sheet(title=xls.sheet_names[1])
-                
-                for row in original_second_sheet.iter_rows():
-                    new_sheet.append([cell.value for cell in row])
-            
-            # Save to buffer
-            output = BytesIO()
-            wb.save(output)
-            output.seek(0)
+            result, profile = finished
+            show_profile(profile)
             
             st.success("Votre fichier est prêt !")
             st.download_button(
                 "Télécharger le fichier",
-                data=output,
+                data=result.output,
                 file_name="donnees_awb.xlsx",
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
             )
             
+        except InvalidFileError as e:
+            st.error(str(e))
         except Exception as e:
             st.error(f"Erreur : {str(e)}")
             import traceback
@@ -0,0 +1,92 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Results kept across Streamlit reruns and sessions of the server process
+MAX_ENTRIES = 32
+MAX_BYTES = 512 * 1024 * 1024
+
+# Facts about uploaded files kept in each session, see per_upload
+MAX_UPLOADS = 16
+
+
+def content_key(app_name, data, *versions):
+    """Cache key for an upload: app, hash of the uploaded bytes (or that hash, see upload_digest) and rule/mapping versions."""
+    digest = data if isinstance(data, str) else hashlib.sha256(data).hexdigest()
+    return (app_name, digest) + tuple(versions)
+
+
+def per_upload(uploaded_file, name, compute):
+    """compute(uploaded bytes) for a Streamlit upload, run once per uploaded file and kept in the session.
+
+    The page reruns on every interaction and every poll of a running job,
+    while an upload's file_id only changes when a file is uploaded again.
+    """
+    import streamlit as st
+    known = st.session_state.setdefault("uploads", OrderedDict())
+    entry = (uploaded_file.file_id, name)
+    if entry not in known:
+        known[entry] = compute(uploaded_file.getvalue())
+        while len(known) > MAX_UPLOADS:
+            known.popitem(last=False)
+    return known[entry]
+
+
+def upload_digest(uploaded_file):
+    """SHA-256 of the uploaded bytes, hashed once per upload (for content_key)."""
+    return per_upload(uploaded_file, "sha256", lambda data: hashlib.sha256(data).hexdigest())
+
+
+def result_size(value):
+    # Approximate memory held by a cached result (bytes outputs and DataFrames)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if hasattr(value, "memory_usage"):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (tuple, list)):
+        return sum(result_size(item) for item in value)
+    return 0
+
+
+class ResultCache:
+    """LRU cache bounded by number of entries and total size, shared by all sessions."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (value, size)
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def put(self, key, value):
+        size = result_size(value)
+        if size > self.max_bytes:
+            return  # Too big to cache, serve it once
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.total_bytes += size
+
+            # Evict least recently used results until both limits hold
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def get_or_compute(self, key, compute):
+        # Computed outside the lock so that other sessions are not blocked meanwhile
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+
+RESULTS = ResultCache()
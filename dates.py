@@ -0,0 +1,88 @@
+import re
+import datetime as dt
+import numpy as np
+import pandas as pd
+
+# Day 0 of Excel serial dates (1900 date system)
+EXCEL_EPOCH = pd.Timestamp("1899-12-30")
+
+# Serial numbers read as dates, from 01/01/1900 to 31/12/9999 like Excel
+EXCEL_SERIALS = (1, 2958465)
+
+# Text formats tried in order: day first before month first, the statements being French
+DAY_FORMATS = ["%d/%m/%Y", "%m/%d/%Y", "%Y-%m-%d", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y", "%m/%d/%y", "%Y/%m/%d"]
+TEXT_FORMATS = DAY_FORMATS + [f + " %H:%M:%S" for f in DAY_FORMATS] + [f + " %H:%M" for f in DAY_FORMATS]
+
+# Dates written as text in the BANQUE import
+EXPORT_FORMAT = "%d/%m/%Y"
+
+
+def text_shape(text):
+    return re.sub(r"\d", "9", text)
+
+
+def text_format(texts):
+    """First of TEXT_FORMATS reading every text (all of one shape), or None.
+
+    Only the texts of the column being parsed decide: when several formats
+    fit (e.g. every date is 03/04/2024-like, valid as dd/mm and mm/dd), the
+    day-first one comes first in TEXT_FORMATS and wins.
+    """
+    for fmt in TEXT_FORMATS:
+        if pd.to_datetime(texts, format=fmt, errors="coerce").notna().all():
+            return fmt
+    return None
+
+
+def parse_texts(texts):
+    # One format per shape; texts no format reads fully are parsed one by one, day first
+    parsed = pd.Series(pd.NaT, index=texts.index, dtype="datetime64[ns]")
+    for _, group in texts.groupby(texts.map(text_shape)):
+        fmt = text_format(group)
+        if fmt is not None:
+            parsed[group.index] = pd.to_datetime(group, format=fmt, errors="coerce")
+        else:
+            parsed[group.index] = pd.to_datetime(group, format="mixed", dayfirst=True, errors="coerce")
+    return parsed
+
+
+def parse_values(values):
+    # Dates of distinct cell values: datetimes as they are, numbers as Excel serials, text by format
+    values = pd.Series(values, dtype=object)
+    parsed = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+
+    is_date = values.map(lambda value: isinstance(value, (dt.date, np.datetime64)))
+    if is_date.any():
+        parsed[is_date] = pd.to_datetime(values[is_date], errors="coerce")
+
+    serials = pd.to_numeric(values.where(values.map(lambda value: isinstance(value, (int, float, np.number))
+                                                    and not isinstance(value, bool))), errors="coerce")
+    is_serial = serials.between(*EXCEL_SERIALS)
+    if is_serial.any():
+        parsed[is_serial] = EXCEL_EPOCH + pd.to_timedelta(serials[is_serial], unit="D")
+
+    texts = values[values.map(lambda value: isinstance(value, str))].str.strip()
+    texts = texts[texts != ""]
+    if len(texts):
+        parsed[texts.index] = parse_texts(texts)
+    return parsed.to_numpy()
+
+
+def to_dates(values):
+    """Dates of a column as datetime64, NaT where empty or unreadable.
+
+    Cells can be dates, Excel serial numbers or text in one of TEXT_FORMATS;
+    each distinct value is parsed once and the result broadcast to its rows.
+    """
+    values = values if isinstance(values, pd.Series) else pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    codes, uniques = pd.factorize(values)
+    # Empty cells (code -1) get the extra NaT at the end
+    dates = np.r_[parse_values(uniques), np.array(["NaT"], dtype="datetime64[ns]")]
+    return pd.Series(dates[codes], index=values.index)
+
+
+def format_dates(dates, fmt=EXPORT_FORMAT):
+    """Dates as text for export, NaN where missing."""
+    return dates.dt.strftime(fmt)
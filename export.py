@@ -0,0 +1,268 @@
+import io
+import gzip
+import importlib.util
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+from itertools import repeat
+
+# Same display as openpyxl's FORMAT_DATE_DMYSLASH
+DATE_FORMAT = "d/m/y"
+
+# Output formats of the data table: label -> (file extension, MIME type)
+XLSX = "Excel (.xlsx)"
+CSV = "CSV"
+PARQUET = "Parquet"
+TARGETS = {
+    XLSX: ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    CSV: ("csv", "text/csv"),
+    PARQUET: ("parquet", "application/vnd.apache.parquet"),
+}
+
+# Settings of the CSV target, as expected by the accounting import
+CsvOptions = namedtuple("CsvOptions", ["sep", "decimal", "encoding", "compress"])
+CSV_SEPARATORS = {";": "Point-virgule (;)", ",": "Virgule (,)", "\t": "Tabulation", "|": "Barre verticale (|)"}
+CSV_ENCODINGS = ["utf-8", "utf-8-sig", "cp1252", "latin-1"]
+
+# Longest sheet name Excel accepts
+MAX_SHEET_NAME = 31
+
+# Rows converted to text (or to Arrow) at a time by the CSV and Parquet writers
+CHUNK_ROWS = 50_000
+
+PARQUET_MISSING = "Le format Parquet nécessite le paquet pyarrow."
+
+
+class ExportError(Exception):
+    """The requested output format cannot be produced (message shown to the user)."""
+
+
+def parquet_available():
+    # Checked without importing pyarrow, which is only loaded when a Parquet file is written
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def unique_sheet_name(name, existing):
+    """name, or name followed by a number (like openpyxl's create_sheet) if existing already has it.
+
+    Excel compares sheet names case-insensitively and rejects names over
+    MAX_SHEET_NAME characters, so the number replaces the end of a long name.
+    """
+    taken = {sheet.lower() for sheet in existing}
+    name = name[:MAX_SHEET_NAME]
+    n = 0
+    candidate = name
+    while candidate.lower() in taken:
+        n += 1
+        candidate = name[:MAX_SHEET_NAME - len(str(n))] + str(n)
+    return candidate
+
+
+def new_workbook(output):
+    """xlsxwriter workbook that streams each row to disk (constant_memory mode).
+
+    Rows must be written top to bottom, which is what write_frame does.
+    """
+    # Imported on first export, not when the app page loads
+    import xlsxwriter
+
+    return xlsxwriter.Workbook(output, {
+        "constant_memory": True,
+        "strings_to_formulas": False,
+        "strings_to_urls": False,
+    })
+
+
+def header_format(workbook, color):
+    # Colored header with white bold text, on top of the usual pandas header borders
+    return workbook.add_format({
+        "bold": True,
+        "font_color": "#FFFFFF",
+        "bg_color": color,
+        "border": 1,
+        "align": "center",
+        "valign": "top",
+    })
+
+
+def column_widths(df, extra=2):
+    # Longest text of each column (header included) plus a little extra space
+    return [
+        max(df[column].astype(str).str.len().max() if len(df) else 0, len(str(column))) + extra
+        for column in df.columns
+    ]
+
+
+def column_values(series):
+    # Python values with None for empty cells, ready for the xlsxwriter write_* calls
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def write_frame(workbook, sheet_name, df, header=None, column_formats=None, widths=None, write_header=True,
+                row_formats=None):
+    """Write df to a new worksheet, one row at a time.
+
+    column_formats maps a column name to a format applied to its data cells
+    (e.g. dates); widths is a list of column widths. row_formats gives a
+    format (or None) per data row, applied to all its cells, empty ones
+    included, that have no column format.
+    """
+    worksheet = workbook.add_worksheet(sheet_name)
+    column_formats = column_formats or {}
+
+    for col_idx, width in enumerate(widths or []):
+        worksheet.set_column(col_idx, col_idx, width)
+
+    row_idx = 0
+    if write_header:
+        worksheet.write_row(0, 0, [str(column) for column in df.columns], header)
+        row_idx = 1
+
+    # Pick the writer once per column instead of once per cell
+    writers = []
+    for column in df.columns:
+        dtype = df[column].dtype
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            write = worksheet.write_datetime
+        elif pd.api.types.is_bool_dtype(dtype):
+            write = worksheet.write_boolean
+        elif pd.api.types.is_numeric_dtype(dtype):
+            write = worksheet.write_number
+        else:
+            write = worksheet.write
+        writers.append((write, column_formats.get(column)))
+
+    rows = zip(*(column_values(df[column]) for column in df.columns))
+    for row, row_format in zip(rows, repeat(None) if row_formats is None else row_formats):
+        for col_idx, value in enumerate(row):
+            write, cell_format = writers[col_idx]
+            cell_format = cell_format or row_format
+            if value is None or value == "":
+                if row_format is not None:
+                    worksheet.write_blank(row_idx, col_idx, None, cell_format)
+                continue
+            write(row_idx, col_idx, value, cell_format)
+        row_idx += 1
+
+    return worksheet
+
+
+def row_ranges(mask, column, first_row=1):
+    """Contiguous runs of True in mask as an A1 range list, e.g. "D1:D40 D45 D50:D52".
+
+    Row i of mask is sheet row first_row + i (1-based). Used for data validations
+    and formats, so that a column gets one entry per run instead of one per cell.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    edges = np.diff(np.r_[0, mask.astype(np.int8), 0])
+    starts = np.flatnonzero(edges == 1) + first_row
+    ends = np.flatnonzero(edges == -1) + first_row - 1
+    return " ".join(
+        f"{column}{start}" if start == end else f"{column}{start}:{column}{end}"
+        for start, end in zip(starts.tolist(), ends.tolist())
+    )
+
+
+def write_csv(df, output, options, date_format=None):
+    """Write df as delimited text to the binary file `output`, CHUNK_ROWS rows at a time.
+
+    Only one chunk is held as text at once; with options.compress the text
+    is gzipped on the fly. Characters the encoding lacks are replaced by "?".
+    """
+    stream = gzip.GzipFile(fileobj=output, mode="wb") if options.compress else output
+    text = io.TextIOWrapper(stream, encoding=options.encoding, errors="replace", newline="")
+    try:
+        for start in range(0, max(len(df), 1), CHUNK_ROWS):
+            df.iloc[start:start + CHUNK_ROWS].to_csv(
+                text, sep=options.sep, decimal=options.decimal, date_format=date_format,
+                index=False, header=start == 0,
+            )
+    finally:
+        text.flush()
+        text.detach()
+        if options.compress:
+            stream.close()
+
+
+def arrow_frame(df):
+    """df with the object columns Arrow cannot type (e.g. TIERS mixing text and numeric codes) as text.
+
+    Missing values stay null; columns of one type are left as they are.
+    """
+    import pyarrow as pa
+    mixed = {}
+    for column in df.columns[df.dtypes == object]:
+        try:
+            pa.array(df[column], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            mixed[column] = df[column].map(str).where(df[column].notna(), None)
+    return df.assign(**mixed) if mixed else df
+
+
+def write_parquet(df, output):
+    """Write df as Parquet to the binary file `output`, one row group per CHUNK_ROWS rows."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ExportError(PARQUET_MISSING) from e
+
+    df = arrow_frame(df)
+    # Types come from the whole frame so that every chunk has the same schema
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(output, schema) as writer:
+        for start in range(0, len(df), CHUNK_ROWS):
+            writer.write_table(pa.Table.from_pandas(df.iloc[start:start + CHUNK_ROWS], schema=schema, preserve_index=False))
+
+
+def convert(df, target, options=None, date_format=None):
+    """df in the CSV or Parquet target, as bytes (what Streamlit's deferred download accepts and keeps)."""
+    output = io.BytesIO()
+    if target == CSV:
+        write_csv(df, output, options, date_format)
+    else:
+        write_parquet(df, output)
+    return output.getvalue()
+
+
+def choose_target(app, options=TARGETS):
+    """Output format picked by the user, with its CsvOptions for CSV (None otherwise).
+
+    Parquet is only offered when pyarrow is installed.
+    """
+    import streamlit as st
+    options = [target for target in options if target != PARQUET or parquet_available()]
+    target = st.radio("Format de sortie", options, horizontal=True, key=f"{app}_target",
+                      help=None if PARQUET in options else PARQUET_MISSING)
+    if target != CSV:
+        return target, None
+    columns = st.columns(4)
+    sep = columns[0].selectbox("Séparateur", list(CSV_SEPARATORS), format_func=CSV_SEPARATORS.get, key=f"{app}_sep")
+    decimal = columns[1].selectbox("Décimales", [",", "."], key=f"{app}_decimal")
+    encoding = columns[2].selectbox("Encodage", CSV_ENCODINGS, key=f"{app}_encoding")
+    compress = columns[3].checkbox("Compresser (gzip)", key=f"{app}_gzip")
+    return target, CsvOptions(sep, decimal, encoding, compress)
+
+
+def download_table(df, file_stem, target, options=None, date_format=None):
+    """Download button for df in the CSV or Parquet target.
+
+    The file is only produced when the button is clicked, chunk by chunk,
+    in Streamlit's download thread; the page does not hold it between clicks.
+    Errors raised there never reach the page, so what can be checked
+    beforehand raises ExportError here.
+    """
+    import streamlit as st
+    if target == PARQUET and not parquet_available():
+        raise ExportError(PARQUET_MISSING)
+    extension, mime = TARGETS[target]
+    file_name = f"{file_stem}.{extension}"
+    if target == CSV and options.compress:
+        file_name, mime = file_name + ".gz", "application/gzip"
+    st.download_button(
+        label="Télécharger le fichier",
+        data=lambda: convert(df, target, options, date_format),
+        file_name=file_name,
+        mime=mime,
+        on_click="ignore",
+    )
@@ -0,0 +1,85 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+
+# Opt-in: SQLite file keeping the classification of rows already seen (unset = classify every row)
+STORE_PATH = os.environ.get("SOYAPRIM_FINGERPRINT_DB")
+
+# Fingerprints per "IN (...)" query, below SQLite's default limit of bound parameters
+CHUNK_SIZE = 900
+
+
+def frame_version(df):
+    """Short hash of the values of a frame (e.g. the mappings sheet), to version results derived from it."""
+    hashes = pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy()
+    return hashlib.sha1(hashes.tobytes()).hexdigest()[:12]
+
+
+def row_fingerprints(fields, *versions):
+    """64-bit fingerprint of each row of `fields` (dict of Series) and of the rule/mapping versions.
+
+    Values are hashed as text, so the same cell gives the same fingerprint
+    whatever the dtype its column was read with.
+    """
+    text = pd.DataFrame({name: series.astype(str) for name, series in fields.items()})
+    hash_key = hashlib.sha1("|".join(map(str, versions)).encode()).hexdigest()[:16]
+    hashes = pd.util.hash_pandas_object(text, index=False, hash_key=hash_key).to_numpy()
+    return hashes.view(np.int64)  # SQLite integers are signed
+
+
+class FingerprintStore:
+    """Outputs of already classified rows, by fingerprint, in one SQLite table per app."""
+
+    def __init__(self, path, table, columns):
+        self.table = table
+        self.columns = list(columns)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (fingerprint INTEGER PRIMARY KEY, {', '.join(self.columns)})"
+            )
+
+    def lookup(self, fingerprints):
+        """Known outputs as a DataFrame aligned on `fingerprints`, with a boolean "known" column."""
+        unique = np.unique(fingerprints)
+        found = []
+        with self.lock:
+            for start in range(0, len(unique), CHUNK_SIZE):
+                chunk = [int(value) for value in unique[start:start + CHUNK_SIZE]]
+                found += self.connection.execute(
+                    f"SELECT fingerprint, {', '.join(self.columns)} FROM {self.table} "
+                    f"WHERE fingerprint IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+
+        known = pd.DataFrame(found, columns=["fingerprint"] + self.columns).set_index("fingerprint")
+        result = known.reindex(fingerprints)
+        result["known"] = pd.Index(fingerprints).isin(known.index)
+        return result.reset_index(drop=True)
+
+    def save(self, fingerprints, outputs):
+        """Record the outputs (DataFrame with the store's columns) of newly classified rows."""
+        values = outputs[self.columns].astype(object).where(outputs[self.columns].notna(), None)
+        rows = [(int(key),) + tuple(row) for key, row in zip(fingerprints, values.itertuples(index=False))]
+        with self.lock, self.connection:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO {self.table} VALUES ({', '.join('?' * (len(self.columns) + 1))})", rows
+            )
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(table, columns):
+    """The app's store when SOYAPRIM_FINGERPRINT_DB is set, else None."""
+    if not STORE_PATH:
+        return None
+    with _stores_lock:
+        if table not in _stores:
+            _stores[table] = FingerprintStore(STORE_PATH, table, columns)
+        return _stores[table]
@@ -0,0 +1,161 @@
+import hashlib
+import posixpath
+import zipfile
+import pandas as pd
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from pandas.io.parsers import TextParser
+
+# Sheet names of the upload and the requested sheets as DataFrames (keyed as requested)
+WorkbookData = namedtuple("WorkbookData", ["sheet_names", "frames"])
+
+NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+NS_PACKAGE_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+
+class InvalidFileError(Exception):
+    """The upload does not have the expected structure (message shown to the user)."""
+
+
+def sheet_part(archive, index):
+    # Path of the XML part of the index-th sheet, from workbook.xml and its relationships
+    sheets = ET.fromstring(archive.read("xl/workbook.xml")).find(f"{NS_MAIN}sheets")
+    if sheets is None or index >= len(sheets):
+        return None
+    rel_id = sheets[index].get(f"{NS_REL}id")
+    for rel in ET.fromstring(archive.read("xl/_rels/workbook.xml.rels")):
+        if rel.get("Id") == rel_id:
+            target = rel.get("Target")
+            return target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+    return None
+
+
+def shared_strings(archive, indexes):
+    # Text of the shared strings at these indexes (runs joined, phonetic hints left out like openpyxl)
+    strings = {}
+    if "xl/sharedStrings.xml" not in archive.namelist() or not indexes:
+        return strings
+    with archive.open("xl/sharedStrings.xml") as part:
+        index = 0
+        for _, element in ET.iterparse(part):
+            if element.tag != f"{NS_MAIN}si":
+                continue
+            if index in indexes:
+                runs = [element.find(f"{NS_MAIN}t")] + [run.find(f"{NS_MAIN}t") for run in element.iter(f"{NS_MAIN}r")]
+                strings[index] = "".join(run.text or "" for run in runs if run is not None)
+            element.clear()
+            index += 1
+    return strings
+
+
+def number_formats(archive):
+    # Number format (code, or built-in id) of each cell style index
+    if "xl/styles.xml" not in archive.namelist():
+        return []
+    styles = ET.fromstring(archive.read("xl/styles.xml"))
+    codes = {fmt.get("numFmtId"): fmt.get("formatCode") for fmt in styles.iter(f"{NS_MAIN}numFmt")}
+    cell_xfs = styles.find(f"{NS_MAIN}cellXfs")
+    if cell_xfs is None:
+        return []
+    return [codes.get(xf.get("numFmtId", "0"), xf.get("numFmtId", "0")) for xf in cell_xfs]
+
+
+def sheet_digest(file, index):
+    """Hash of the values of a sheet, taken from its XML without building cells or a DataFrame.
+
+    Each cell with a value contributes its position, type, value (shared
+    strings resolved to their text) and number format, so the digest does
+    not depend on the other sheets even when they share the shared-strings
+    table or the styles (as in any workbook saved by Excel). Equal digests
+    mean equal sheet values. None if the sheet does not exist or the file is
+    not a readable .xlsx.
+    """
+    if hasattr(file, "seek"):
+        file.seek(0)
+    try:
+        with zipfile.ZipFile(file) as archive:
+            part = sheet_part(archive, index)
+            if part is None or part not in archive.namelist():
+                return None
+
+            # (position, type, value, style) of the cells holding a value
+            cells = []
+            with archive.open(part) as sheet:
+                for _, element in ET.iterparse(sheet):
+                    if element.tag == f"{NS_MAIN}c":
+                        value = element.find(f"{NS_MAIN}v")
+                        inline = element.find(f"{NS_MAIN}is")
+                        if inline is not None:
+                            text = "".join(t.text or "" for t in inline.iter(f"{NS_MAIN}t"))
+                        else:
+                            text = value.text if value is not None else None
+                        if text is not None:
+                            cells.append((element.get("r"), element.get("t", "n"), text, int(element.get("s", "0"))))
+                    if element.tag in (f"{NS_MAIN}c", f"{NS_MAIN}row"):
+                        element.clear()
+
+            strings = shared_strings(archive, {int(text) for _, kind, text, _ in cells if kind == "s"})
+            formats = number_formats(archive)
+            workbook_pr = ET.fromstring(archive.read("xl/workbook.xml")).find(f"{NS_MAIN}workbookPr")
+
+            digest = hashlib.sha256()
+            # Serial numbers are days since 1904 instead of 1900 in such workbooks
+            digest.update(str(workbook_pr is not None and workbook_pr.get("date1904") in ("1", "true")).encode())
+            for position, kind, text, style in cells:
+                if kind == "s":
+                    kind, text = "str", strings.get(int(text), "")
+                elif kind == "inlineStr":
+                    kind = "str"
+                number_format = formats[style] if style < len(formats) else "0"
+                digest.update(repr((position, kind, text, number_format)).encode())
+            return digest.hexdigest()
+    except (zipfile.BadZipFile, KeyError, ValueError, ET.ParseError):
+        return None
+
+
+def sheet_rows(worksheet, max_rows=None):
+    # Same cleanup as pd.read_excel: empty cells become "", trailing empty cells and rows are dropped
+    rows = []
+    last_row = 0
+    for row in worksheet.iter_rows(max_row=max_rows, values_only=True):
+        values = ["" if value is None else value for value in row]
+        while values and values[-1] == "":
+            values.pop()
+        rows.append(values)
+        if values:
+            last_row = len(rows)
+    rows = rows[:last_row]
+
+    width = max((len(values) for values in rows), default=0)
+    return [values + [""] * (width - len(values)) for values in rows]
+
+
+def read_workbook(file, sheets=(0,), max_rows=None):
+    """Read several sheets of an uploaded .xlsx in a single pass over the file.
+
+    `sheets` holds sheet indexes or names. Sheets that do not exist are left out
+    of `frames`. Columns are typed like pd.read_excel(..., header=None).
+    `max_rows` maps some of the requested sheets to the number of rows read
+    from their top (the rest of those sheets is not parsed).
+    """
+    # Imported on first read, not when the app page loads
+    from openpyxl import load_workbook
+
+    if hasattr(file, "seek"):
+        file.seek(0)
+    workbook = load_workbook(file, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet_names = workbook.sheetnames
+        frames = {}
+        for sheet in sheets:
+            name = sheet_names[sheet] if isinstance(sheet, int) and sheet < len(sheet_names) else sheet
+            if name not in sheet_names:
+                continue
+            worksheet = workbook[name]
+            worksheet.reset_dimensions()
+            rows = sheet_rows(worksheet, (max_rows or {}).get(sheet))
+            frames[sheet] = TextParser(rows, header=None).read() if rows else pd.DataFrame()
+    finally:
+        workbook.close()
+    return WorkbookData(sheet_names, frames)
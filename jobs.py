@@ -0,0 +1,199 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from cache import RESULTS
+from timing import Profile, profiling
+
+# Pipelines running at the same time for all sessions; later jobs wait in submission order
+MAX_JOBS = int(os.environ.get("SOYAPRIM_JOBS", "2"))
+
+# Finished jobs kept so that every session watching them gets the result
+MAX_FINISHED = 8
+
+# Delay between two refreshes of a page waiting for its job
+POLL_SECONDS = 0.5
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobCancelled(Exception):
+    """Raised at the start of the next stage of a cancelled job."""
+
+
+class Job:
+    """One pipeline run in the background, shared by the sessions that uploaded the same content.
+
+    `stages` lists the stage names of the pipeline in order (see timing.stage):
+    progress is the share of them done so far.
+    """
+
+    def __init__(self, app, key, compute, stages):
+        self.app = app
+        self.key = key
+        self.compute = compute
+        self.stages = list(stages)
+        self.owners = set()
+        self.state = QUEUED
+        self.progress = 0.0
+        self.current = None  # Record of the running stage (name and rows)
+        self.result = None
+        self.error = None
+        self.profile = None
+        self.cancelled = threading.Event()
+        self.future = None
+
+    @property
+    def finished(self):
+        return self.state in (DONE, FAILED, CANCELLED)
+
+    def on_stage(self, record, finished):
+        if not finished:
+            # Threads cannot be interrupted: a cancelled job stops when its next stage starts
+            if self.cancelled.is_set():
+                raise JobCancelled()
+            self.current = record
+        elif record["stage"] in self.stages:
+            done = (self.stages.index(record["stage"]) + 1) / len(self.stages)
+            self.progress = max(self.progress, done)
+
+    def run(self):
+        if self.cancelled.is_set():
+            self.state = CANCELLED
+            return
+        self.state = RUNNING
+        try:
+            with profiling(self.app) as profile:
+                self.profile = profile
+                profile.on_stage = self.on_stage
+                self.result = RESULTS.get_or_compute(self.key, self.compute)
+            self.progress = 1.0
+            self.state = DONE
+        except JobCancelled:
+            self.state = CANCELLED
+        except Exception as e:
+            self.error = e
+            self.state = FAILED
+
+    def release(self, owner):
+        """The session no longer waits for this job; cancel it if nobody else does."""
+        self.owners.discard(owner)
+        if not self.owners and not self.finished:
+            self.cancelled.set()
+            if self.future is not None and self.future.cancel():
+                self.state = CANCELLED
+
+    def status(self):
+        if self.state == QUEUED:
+            return "En attente d'un traitement en cours…"
+        if self.current is None:
+            return "Démarrage…"
+        rows = self.current.get("rows")
+        text = f"Étape « {self.current['stage']} »"
+        return f"{text} : {rows:,} lignes".replace(",", " ") if rows else text
+
+
+class JobQueue:
+    """Shared worker threads and the jobs submitted to them, by result cache key.
+
+    Sessions uploading the same content share one job, and the thread pool
+    runs jobs in submission order, so a large upload never blocks the
+    interpreter for everyone else beyond its own worker.
+    """
+
+    def __init__(self, max_workers=MAX_JOBS):
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="soyaprim-job")
+        self.jobs = OrderedDict()  # key -> Job, oldest first
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            return self.jobs.get(key)
+
+    def submit(self, app, key, compute, stages, owner):
+        """Job computing this key for owner, joining the one already queued or running if any."""
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is None or job.state in (FAILED, CANCELLED) or job.cancelled.is_set():
+                job = Job(app, key, compute, stages)
+                self.jobs[key] = job
+                self.jobs.move_to_end(key)
+                job.future = self.executor.submit(job.run)
+            job.owners.add(owner)
+
+            # Forget the oldest finished jobs
+            finished = [old_key for old_key, old_job in self.jobs.items() if old_job.finished]
+            for old_key in finished[:max(0, len(finished) - MAX_FINISHED)]:
+                del self.jobs[old_key]
+            return job
+
+
+JOBS = JobQueue()
+
+
+def run_job(app, key, compute, stages):
+    """(result, profile) of compute() for this upload, run as a background job; None while it runs.
+
+    Meanwhile the page shows a progress bar and a cancel button and reruns
+    itself every POLL_SECONDS. The result is attached to the session when
+    ready, so later reruns (e.g. the download button) get it at once. A
+    failed run raises its error again on later reruns of the same key,
+    without running, until the user restarts it.
+    """
+    import streamlit as st
+    session = st.session_state
+    owner = session.setdefault("session_id", uuid.uuid4().hex)
+    attached = session.get(f"{app}_result")
+    if attached is not None and attached[0] == key:
+        return attached[1], attached[2]
+
+    # Cancelled by this session: wait for an explicit restart
+    if session.get(f"{app}_cancelled") == key:
+        st.warning("Traitement annulé.")
+        if not st.button("Relancer le traitement"):
+            return None
+        del session[f"{app}_cancelled"]
+
+    # Failed for this upload: the same input would fail again, so show the error until a restart
+    failed = session.get(f"{app}_failed")
+    if failed is not None and failed[0] == key:
+        if not st.button("Relancer le traitement"):
+            raise failed[1]
+        del session[f"{app}_failed"]
+
+    # A new upload replaces the job of the previous one
+    job = JOBS.get(session.get(f"{app}_job"))
+    if job is not None and job.key != key:
+        job.release(owner)
+        job = None
+    if job is None or job.state == CANCELLED:
+        cached = RESULTS.get(key)
+        if cached is not None:
+            session[f"{app}_result"] = (key, cached, Profile(app))
+            return cached, session[f"{app}_result"][2]
+        job = JOBS.submit(app, key, compute, stages, owner)
+        session[f"{app}_job"] = key
+
+    if job.state == DONE:
+        session[f"{app}_result"] = (key, job.result, job.profile)
+        session.pop(f"{app}_job", None)
+        return job.result, job.profile
+    if job.state == FAILED:
+        session[f"{app}_failed"] = (key, job.error)
+        session.pop(f"{app}_job", None)
+        raise job.error
+
+    st.progress(job.progress, text=job.status())
+    if st.button("Annuler"):
+        job.release(owner)
+        session[f"{app}_cancelled"] = key
+        session.pop(f"{app}_job", None)
+        st.rerun()
+    time.sleep(POLL_SECONDS)
+    st.rerun()
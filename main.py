@@ -1,5 +1,5 @@
 import streamlit as st
-from PIL import Image
+import warmup
 
 # Custom CSS for styling
 st.markdown("""
@@ -28,7 +28,10 @@ app_choice = st.sidebar.radio(
     ("REFERENCE", "BANQUE", "ACHATS")
 )
 
-# Load the selected app
+# Optional preload of the pipelines in the background (SOYAPRIM_WARMUP=1)
+warmup.start()
+
+# Load the selected app (its module, and pandas with it, is only imported once selected)
 if app_choice == "REFERENCE":
     from bq_ref import app as bq_ref_app
     bq_ref_app()
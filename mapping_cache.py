@@ -0,0 +1,114 @@
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from fingerprints import frame_version
+from mapping_index import MappingIndex
+
+# Compiled mappings (MappingIndex pickles named by content hash), shared by every session and restart
+CACHE_DIR = os.environ.get(
+    "SOYAPRIM_MAPPING_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".mapping_cache")
+)
+
+# Compiled mappings kept in memory
+MAX_LOADED = 8
+
+
+def write_atomic(path, data):
+    # Readers never see a half-written file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class MappingCache:
+    """Mapping tables compiled once, identified by the hash of their values.
+
+    Besides the content hash, the digest of the mappings sheet XML (see
+    ingest.sheet_digest) is recorded as an alias, so a known upload is matched
+    without parsing its sheet, and the last compiled table is kept as the
+    master list for uploads that have no mappings sheet.
+    """
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+        self.loaded = OrderedDict()  # version -> MappingIndex
+        self.lock = threading.Lock()
+
+    def path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    def read_text(self, *parts):
+        try:
+            with open(self.path(*parts)) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def write_text(self, text, *parts):
+        try:
+            os.makedirs(os.path.dirname(self.path(*parts)), exist_ok=True)
+            write_atomic(self.path(*parts), text.encode())
+        except OSError:
+            pass  # The cache is an optimization, a read-only disk only disables it
+
+    def remember(self, version, mapping_index):
+        self.loaded[version] = mapping_index
+        self.loaded.move_to_end(version)
+        while len(self.loaded) > MAX_LOADED:
+            self.loaded.popitem(last=False)
+
+    def load(self, version):
+        """Compiled mappings of this content hash, or None if unknown."""
+        with self.lock:
+            if version in self.loaded:
+                self.loaded.move_to_end(version)
+                return self.loaded[version]
+            try:
+                with open(self.path(f"{version}.pickle"), "rb") as f:
+                    mapping_index = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+                return None
+            self.remember(version, mapping_index)
+            return mapping_index
+
+    def compile(self, mappings_df, alias=None):
+        """Compiled mappings of a parsed sheet, reusing the stored version when its content is known."""
+        version = frame_version(mappings_df[[0, 1]])
+        mapping_index = self.load(version)
+        if mapping_index is None:
+            mapping_index = MappingIndex.from_frame(mappings_df)
+            mapping_index.version = version
+            with self.lock:
+                self.remember(version, mapping_index)
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                write_atomic(self.path(f"{version}.pickle"), pickle.dumps(mapping_index, protocol=pickle.HIGHEST_PROTOCOL))
+            except OSError:
+                pass
+        if alias is not None:
+            self.write_text(version, "aliases", alias)
+        self.write_text(version, "latest")
+        return mapping_index
+
+    def by_alias(self, alias):
+        """Compiled mappings of a sheet already seen with the same digest, or None."""
+        version = self.read_text("aliases", alias)
+        return self.load(version) if version else None
+
+    def latest_version(self):
+        return self.read_text("latest")
+
+    def latest(self):
+        """The last compiled mapping table (master list), or None."""
+        version = self.latest_version()
+        return self.load(version) if version else None
+
+
+MAPPINGS = MappingCache()
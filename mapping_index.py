@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+from collections import defaultdict
+
+# Length of the substrings indexed for each mapping key
+GRAM_SIZE = 3
+
+# Trigrams in more than this share of the keys (and at least COMMON_GRAM_KEYS of them),
+# e.g. "ste" or "arl" in company names, do not pick suggestion candidates
+COMMON_GRAM_SHARE = 0.05
+COMMON_GRAM_KEYS = 256
+
+
+def key_grams(text):
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+def key_gram_counts(keys):
+    return np.array([len(key_grams(key)) for key in keys], dtype=np.int64)
+
+
+class MappingIndex:
+    """Trigram index over the mappings sheet (column 0 = key, column 1 = TIERS).
+
+    find(tier) returns the value of the first mapping whose key contains tier
+    (case-insensitive, literal match), like scanning the sheet top to bottom.
+    suggest(tier, k) ranks the mappings by trigram similarity for tiers that
+    find nothing.
+    """
+
+    def __init__(self, keys, values):
+        self.keys = [str(key).lower() for key in keys]
+        self.values = list(values)
+
+        # Trigram -> positions of the keys containing it, in sheet order
+        self.postings = defaultdict(list)
+        for pos, key in enumerate(self.keys):
+            for gram in key_grams(key):
+                self.postings[gram].append(pos)
+        self.gram_counts = key_gram_counts(self.keys)
+        self.common = self.common_grams()
+
+        # Content hash of the mappings, set when compiled through mapping_cache
+        self.version = None
+
+    def __setstate__(self, state):
+        # Indexes compiled with a per-index lookup cache (callers now look up each distinct tier once)
+        state.pop("cache", None)
+        self.__dict__.update(state)
+        # Indexes compiled before suggest() existed
+        if "gram_counts" not in state:
+            self.gram_counts = key_gram_counts(self.keys)
+        if "common" not in state:
+            self.common = self.common_grams()
+
+    def common_grams(self):
+        # Trigram -> whether each key contains it, for the trigrams too common to pick candidates
+        limit = max(COMMON_GRAM_KEYS, COMMON_GRAM_SHARE * len(self.keys))
+        common = {}
+        for gram, positions in self.postings.items():
+            if len(positions) > limit:
+                common[gram] = np.zeros(len(self.keys), dtype=bool)
+                common[gram][positions] = True
+        return common
+
+    @classmethod
+    def from_frame(cls, mappings_df):
+        return cls(mappings_df[0].astype(str), mappings_df[1])
+
+    def candidates(self, needle):
+        # Short tiers have no trigram: every key is a candidate
+        if len(needle) < GRAM_SIZE:
+            return range(len(self.keys))
+
+        # Every key containing the needle contains all its trigrams, so the
+        # rarest trigram's posting list is enough to find the first match
+        smallest = None
+        for gram in key_grams(needle):
+            positions = self.postings.get(gram)
+            if not positions:
+                return ()
+            if smallest is None or len(positions) < len(smallest):
+                smallest = positions
+        return smallest
+
+    def find(self, tier):
+        # Not memoized: the index is shared by every session, callers look up each distinct tier once
+        needle = str(tier).lower()
+        for pos in self.candidates(needle):
+            if needle in self.keys[pos]:
+                return self.values[pos]
+        return np.nan
+
+    def suggest(self, tier, k, min_score=0.0):
+        """Up to k (TIERS, score) pairs whose keys look most like tier, best first.
+
+        The score is the Dice coefficient of the trigram sets (1.0 for the same
+        trigrams); keys scoring below min_score are left out. Candidates are the
+        keys sharing one of tier's less common trigrams, found through the
+        postings, so the work does not grow with the keys that only share
+        frequent ones. A TIERS reached by several keys keeps its best score.
+        """
+        grams = key_grams(str(tier).lower())
+        postings = [self.postings[gram] for gram in grams if gram in self.postings and gram not in self.common]
+        if not postings:
+            return []
+        positions, shared = np.unique(np.concatenate(postings), return_counts=True)
+        for gram in grams & self.common.keys():
+            shared += self.common[gram][positions]
+        scores = 2 * shared / (len(grams) + self.gram_counts[positions])
+
+        # Best score first, then sheet order
+        suggestions = []
+        for idx in np.lexsort((positions, -scores)):
+            if scores[idx] < min_score:
+                break
+            value = self.values[positions[idx]]
+            if pd.isna(value) or any(value == seen for seen, _ in suggestions):
+                continue
+            suggestions.append((value, round(float(scores[idx]), 2)))
+            if len(suggestions) == k:
+                break
+        return suggestions
@@ -0,0 +1,265 @@
+import re
+import zipfile
+import posixpath
+from io import BytesIO
+from xml.sax.saxutils import escape, quoteattr
+import xml.etree.ElementTree as ET
+from export import unique_sheet_name
+from ingest import NS_MAIN, NS_PACKAGE_REL, sheet_part
+
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+WORKSHEET_REL = REL_NS + "/worksheet"
+SHARED_STRINGS_REL = REL_NS + "/sharedStrings"
+STYLES_REL = REL_NS + "/styles"
+WORKSHEET_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+SHARED_STRINGS_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"
+
+# Style collections merged from the source package, with the attribute that references each one
+STYLE_SECTIONS = [("fonts", "font", "fontId"), ("fills", "fill", "fillId"), ("borders", "border", "borderId")]
+
+# First id of custom number formats (lower ids are built in)
+FIRST_CUSTOM_NUMFMT = 164
+
+# Sheet elements pointing to parts that are not copied (drawings, comments, tables, external links)
+UNCOPIED_ELEMENTS = ["drawing", "legacyDrawing", "legacyDrawingHF", "picture", "oleObjects", "controls",
+                     "tableParts", "hyperlinks"]
+
+
+class PassthroughError(Exception):
+    """The sheet cannot be copied at the zip level (caller falls back to copying values)."""
+
+
+def section(xml, tag):
+    # (whole element, children xml) of the first <tag>, or (None, "") if absent
+    match = re.search(rf"<{tag}\b[^>]*?(?:/>|>(.*?)</{tag}>)", xml, re.S)
+    if match is None:
+        return None, ""
+    return match.group(0), match.group(1) or ""
+
+
+def children(inner, tag):
+    return re.findall(rf"<{tag}\b(?:[^>]*?/>|.*?</{tag}>)", inner, re.S)
+
+
+def strip_extensions(fragment):
+    # Prefixed attributes (x14ac:...) and extension lists need namespaces the target may not declare
+    fragment = re.sub(r"<extLst>.*?</extLst>", "", fragment, flags=re.S)
+    return re.sub(r'\s[\w.-]+:[\w.-]+="[^"]*"', "", fragment)
+
+
+def shift_attribute(fragment, name, offset=0, mapping=None):
+    def replace(match):
+        value = int(match.group(2))
+        value = mapping.get(value, value) if mapping is not None else value + offset
+        return f'{match.group(1)}"{value}"'
+    return re.sub(rf'(\b{name}=)"(\d+)"', replace, fragment)
+
+
+def set_section(xml, tag, items, before):
+    """Replace the <tag> collection of a styles part by items, creating it before one of `before` if absent."""
+    element, _ = section(xml, tag)
+    new = f'<{tag} count="{len(items)}">{"".join(items)}</{tag}>' if items else f'<{tag} count="0"/>'
+    if element is not None:
+        return xml.replace(element, new, 1)
+    for following in before:
+        position = re.search(rf"<{following}\b", xml)
+        if position:
+            return xml[:position.start()] + new + xml[position.start():]
+    return xml.replace("</styleSheet>", new + "</styleSheet>")
+
+
+def merge_styles(target, source):
+    """Append the source cell formats to the target styles; returns (styles xml, xf offset, dxf offset)."""
+    if not re.search(r"<styleSheet\b", source) or not re.search(r"<styleSheet\b", target):
+        raise PassthroughError("styles.xml inattendu")
+
+    # Custom number formats get new ids after the target's own
+    _, target_formats = section(target, "numFmts")
+    _, source_formats = section(source, "numFmts")
+    target_formats = children(target_formats, "numFmt")
+    used = [int(id_) for id_ in re.findall(r'numFmtId="(\d+)"', "".join(target_formats))]
+    next_id = max(used + [FIRST_CUSTOM_NUMFMT - 1]) + 1
+    numfmt_map = {}
+    formats = list(target_formats)
+    for fmt in children(source_formats, "numFmt"):
+        old_id = int(re.search(r'numFmtId="(\d+)"', fmt).group(1))
+        if old_id >= FIRST_CUSTOM_NUMFMT:
+            numfmt_map[old_id] = next_id
+            formats.append(shift_attribute(strip_extensions(fmt), "numFmtId", mapping={old_id: next_id}))
+            next_id += 1
+
+    # Fonts, fills and borders are appended, cell formats point to them with an offset
+    offsets = {}
+    for tag, item, attribute in STYLE_SECTIONS:
+        _, target_inner = section(target, tag)
+        _, source_inner = section(source, tag)
+        target_items = children(target_inner, item)
+        offsets[attribute] = len(target_items)
+        target = set_section(target, tag, target_items + [strip_extensions(x) for x in children(source_inner, item)],
+                             ["cellStyleXfs", "cellXfs"])
+
+    def remap(fragment):
+        fragment = shift_attribute(strip_extensions(fragment), "numFmtId", mapping=numfmt_map)
+        for attribute, offset in offsets.items():
+            fragment = shift_attribute(fragment, attribute, offset)
+        return fragment
+
+    # Cell formats keep the default cell style (named styles are not copied)
+    _, target_inner = section(target, "cellXfs")
+    _, source_inner = section(source, "cellXfs")
+    target_xfs = children(target_inner, "xf")
+    source_xfs = [re.sub(r'\bxfId="\d+"', 'xfId="0"', remap(xf)) for xf in children(source_inner, "xf")]
+    target = set_section(target, "cellXfs", target_xfs + source_xfs, ["cellStyles", "dxfs"])
+
+    # Differential formats of conditional formatting
+    _, target_inner = section(target, "dxfs")
+    _, source_inner = section(source, "dxfs")
+    target_dxfs = children(target_inner, "dxf")
+    source_dxfs = [remap(dxf) for dxf in children(source_inner, "dxf")]
+    target = set_section(target, "dxfs", target_dxfs + source_dxfs, ["tableStyles", "colors", "extLst"])
+
+    target = set_section(target, "numFmts", formats, ["fonts"])
+    return target, len(target_xfs), len(target_dxfs)
+
+
+def rewrite_sheet(xml, xf_offset, dxf_offset):
+    """Sheet XML pointing to the merged styles, without the parts that are not copied."""
+    if not re.match(rb"(<\?xml[^>]*\?>\s*)?<worksheet\b", xml):
+        raise PassthroughError("feuille au format inattendu")
+
+    # Style indexes only appear on <c>, <row> and <col>; the cells are most of the part
+    def shift_tag(match):
+        return re.sub(rb'(\s(?:s|style)=)"(\d+)"', lambda m: m.group(1) + b'"%d"' % (int(m.group(2)) + xf_offset),
+                      match.group(0))
+    xml = re.sub(rb"<(?:c|row|col)\s[^>]*>", shift_tag, xml)
+    if dxf_offset:
+        xml = re.sub(rb'(<cfRule\b[^>]*?\sdxfId=)"(\d+)"', lambda m: m.group(1) + b'"%d"' % (int(m.group(2)) + dxf_offset),
+                     xml)
+
+    for tag in UNCOPIED_ELEMENTS:
+        xml = re.sub(rb"<%s\b(?:[^>]*?/>|.*?</%s>)" % (tag.encode(), tag.encode()), b"", xml, flags=re.S)
+    prefix = re.search(rb'xmlns:([\w.-]+)="%s"' % REL_NS.encode(), xml)
+    if prefix:
+        xml = re.sub(rb'\s%s:id="[^"]*"' % re.escape(prefix.group(1)), b"", xml)
+
+    # Only the first sheet of the output stays selected
+    return re.sub(rb'\stabSelected="1"', b"", xml)
+
+
+def related_part(archive, rel_type):
+    # Path of the workbook part of this relationship type (shared strings, styles), or None
+    try:
+        rels = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    except KeyError:
+        return None
+    for rel in rels.iter(f"{NS_PACKAGE_REL}Relationship"):
+        if rel.get("Type") == rel_type:
+            target = rel.get("Target")
+            path = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+            return path if path in archive.namelist() else None
+    return None
+
+
+def add_title(app_xml, title):
+    """docProps/app.xml listing one more worksheet title (unchanged if its layout is not the usual one)."""
+    count = re.search(r"(<vt:lpstr>Worksheets</vt:lpstr></vt:variant><vt:variant><vt:i4>)(\d+)(</vt:i4>)", app_xml)
+    titles = re.search(r'(<TitlesOfParts><vt:vector size=")(\d+)("[^>]*>)(.*?)(</vt:vector>)', app_xml, re.S)
+    if count is None or titles is None:
+        return app_xml
+
+    # Sheet titles come first, then those of other headings (e.g. named ranges)
+    sheets = int(count.group(2))
+    parts = re.findall(r"<vt:lpstr>.*?</vt:lpstr>", titles.group(4), re.S)
+    parts.insert(sheets, f"<vt:lpstr>{escape(title)}</vt:lpstr>")
+    app_xml = (app_xml[:titles.start()] + titles.group(1) + str(int(titles.group(2)) + 1) + titles.group(3)
+               + "".join(parts) + titles.group(5) + app_xml[titles.end():])
+    return app_xml.replace(count.group(0), f"{count.group(1)}{sheets + 1}{count.group(3)}", 1)
+
+
+def next_rel_id(rels):
+    ids = [int(id_) for id_ in re.findall(r'Id="rId(\d+)"', rels)]
+    return max(ids + [0]) + 1
+
+
+def copy_sheet(output, source, index):
+    """Add the index-th sheet of the `source` .xlsx to the `output` .xlsx bytes, at the zip level.
+
+    The sheet XML is copied as is, apart from its style indexes: its cell
+    formats, fonts, fills, borders and number formats are appended to the
+    output styles, and the source shared strings are copied verbatim (the
+    output must not have its own, which is the case of xlsxwriter's
+    constant_memory mode). The sheet keeps its name unless the output has
+    it already (see export.unique_sheet_name). Drawings, comments, tables
+    and hyperlinks are dropped. Returns output unchanged if the source has
+    no such sheet.
+    """
+    if hasattr(source, "seek"):
+        source.seek(0)
+    try:
+        source_zip = zipfile.ZipFile(source)
+    except zipfile.BadZipFile as e:
+        raise PassthroughError(str(e)) from e
+
+    with source_zip, zipfile.ZipFile(BytesIO(output)) as output_zip:
+        part = sheet_part(source_zip, index)
+        if part is None:
+            return output
+        names = set(output_zip.namelist())
+        if "xl/sharedStrings.xml" in names:
+            raise PassthroughError("le classeur produit a déjà des chaînes partagées")
+
+        sheets = ET.fromstring(source_zip.read("xl/workbook.xml")).find(f"{NS_MAIN}sheets")
+        workbook = output_zip.read("xl/workbook.xml").decode("utf-8")
+        output_sheets = ET.fromstring(workbook).find(f"{NS_MAIN}sheets")
+        sheet_name = unique_sheet_name(sheets[index].get("name"), [sheet.get("name") for sheet in output_sheets])
+
+        # Without a styles part every source cell has the default format, which is also ours
+        styles_part = related_part(source_zip, STYLES_REL)
+        styles, xf_offset, dxf_offset = None, 0, 0
+        if styles_part is not None:
+            styles, xf_offset, dxf_offset = merge_styles(
+                output_zip.read("xl/styles.xml").decode("utf-8"), source_zip.read(styles_part).decode("utf-8")
+            )
+        sheet = rewrite_sheet(source_zip.read(part), xf_offset, dxf_offset)
+
+        # New parts and the references to them
+        n = 1
+        while f"xl/worksheets/sheet{n}.xml" in names:
+            n += 1
+        sheet_path = f"xl/worksheets/sheet{n}.xml"
+
+        rels = output_zip.read("xl/_rels/workbook.xml.rels").decode("utf-8")
+        types = output_zip.read("[Content_Types].xml").decode("utf-8")
+
+        rel_id = next_rel_id(rels)
+        sheet_id = max([int(id_) for id_ in re.findall(r'sheetId="(\d+)"', workbook)] + [0]) + 1
+        workbook = workbook.replace(
+            "</sheets>", f'<sheet name={quoteattr(sheet_name)} sheetId="{sheet_id}" r:id="rId{rel_id}"/></sheets>', 1
+        )
+        new_rels = [f'<Relationship Id="rId{rel_id}" Type="{WORKSHEET_REL}" Target="worksheets/sheet{n}.xml"/>']
+        new_types = [f'<Override PartName="/{sheet_path}" ContentType="{WORKSHEET_TYPE}"/>']
+        new_parts = {sheet_path: sheet}
+
+        strings_part = related_part(source_zip, SHARED_STRINGS_REL)
+        if strings_part is not None:
+            new_rels.append(f'<Relationship Id="rId{rel_id + 1}" Type="{SHARED_STRINGS_REL}" Target="sharedStrings.xml"/>')
+            new_types.append(f'<Override PartName="/xl/sharedStrings.xml" ContentType="{SHARED_STRINGS_TYPE}"/>')
+            new_parts["xl/sharedStrings.xml"] = source_zip.read(strings_part)
+
+        replaced = {
+            "xl/workbook.xml": workbook.encode("utf-8"),
+            "xl/_rels/workbook.xml.rels": rels.replace("</Relationships>", "".join(new_rels) + "</Relationships>").encode("utf-8"),
+            "[Content_Types].xml": types.replace("</Types>", "".join(new_types) + "</Types>").encode("utf-8"),
+        }
+        if styles is not None:
+            replaced["xl/styles.xml"] = styles.encode("utf-8")
+        if "docProps/app.xml" in names:
+            replaced["docProps/app.xml"] = add_title(output_zip.read("docProps/app.xml").decode("utf-8"), sheet_name).encode("utf-8")
+
+        result = BytesIO()
+        with zipfile.ZipFile(result, "w", zipfile.ZIP_DEFLATED) as archive:
+            for info in output_zip.infolist():
+                archive.writestr(info, replaced.get(info.filename) or output_zip.read(info.filename))
+            for name, data in new_parts.items():
+                archive.writestr(name, data)
+        return result.getvalue()
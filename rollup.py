@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+
+# Kind of each output row of a rollup
+DETAIL = "detail"
+SUBTOTAL = "subtotal"
+TOTAL = "total"
+
+# Output rows in order, the kind of each row and whether it belongs to the empty group
+Rollup = namedtuple("Rollup", ["frame", "kinds", "missing"])
+
+
+def rollup(df, group, detail, values, missing_label="Vide", total_label="Total", grand_total=True):
+    """Sums of `values` per (group, detail), a subtotal after each group and an optional grand total.
+
+    Rows come out in their final order from a single groupby: groups and
+    details sorted, rows whose group is empty last under `missing_label`,
+    each subtotal (detail = `total_label`) right after its group's details
+    and the grand total (group = `total_label`, detail = "") at the end.
+    Subtotals and the grand total are summed from the detail sums, not from
+    the input rows again.
+    """
+    sums = df.groupby([group, detail], sort=True, dropna=False)[values].sum()
+    groups = sums.index.get_level_values(0)
+    codes = pd.factorize(groups, use_na_sentinel=False)[0]
+
+    # Groups are contiguous once sorted: the subtotal of group i goes after its last
+    # detail row, shifted by the i subtotals written before it
+    n_groups = codes.max() + 1 if len(codes) else 0
+    group_ends = np.flatnonzero(np.r_[codes[1:] != codes[:-1], True]) if len(codes) else np.array([], dtype=int)
+    detail_positions = np.arange(len(sums)) + codes
+    subtotal_positions = group_ends + np.arange(n_groups) + 1
+    n_rows = len(sums) + n_groups + (1 if grand_total else 0)
+
+    group_sums = sums.to_numpy()
+    subtotals = np.add.reduceat(group_sums, np.r_[0, group_ends[:-1] + 1], axis=0) if n_groups else group_sums[:0]
+    group_values = np.asarray(groups[group_ends], dtype=object) if n_groups else np.array([], dtype=object)
+
+    labels = np.empty((n_rows, 2), dtype=object)
+    labels[detail_positions, 0] = np.asarray(groups, dtype=object)
+    labels[detail_positions, 1] = np.asarray(sums.index.get_level_values(1), dtype=object)
+    labels[subtotal_positions, 0] = group_values
+    labels[subtotal_positions, 1] = total_label
+
+    amounts = np.zeros((n_rows, len(values)), dtype=group_sums.dtype)
+    amounts[detail_positions] = group_sums
+    amounts[subtotal_positions] = subtotals
+
+    kinds = np.full(n_rows, DETAIL, dtype=object)
+    kinds[subtotal_positions] = SUBTOTAL
+
+    # Empty groups (NaN, sorted last by groupby) are shown under missing_label
+    missing = pd.isna(labels[:, 0])
+    if grand_total:
+        labels[-1] = [total_label, ""]
+        amounts[-1] = subtotals.sum(axis=0)
+        kinds[-1] = TOTAL
+        missing[-1] = False
+    labels[missing, 0] = missing_label
+
+    frame = pd.DataFrame({group: labels[:, 0], detail: labels[:, 1]})
+    for col_idx, column in enumerate(values):
+        frame[column] = amounts[:, col_idx]
+    return Rollup(frame, kinds, missing)
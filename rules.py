@@ -0,0 +1,206 @@
+import os
+import re
+import hashlib
+import numpy as np
+import pandas as pd
+from io import BytesIO
+
+# Directory holding the rule files (can be overridden to edit rules without redeploying)
+RULES_DIR = os.environ.get("SOYAPRIM_RULES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules"))
+
+TEXT_OPERATORS = ("equals", "startswith", "contains", "matches")
+AMOUNT_OPERATORS = ("amount-range",)
+
+RULE_COLUMNS = ["rule", "priority", "field", "operator", "value", "ignore_case", "output"]
+
+
+def parse_range(value):
+    # "[1;1]" -> 1 <= x <= 1, "(50000;)" -> x > 50000, an empty bound is unbounded
+    value = value.strip()
+    if len(value) < 3 or value[0] not in "[(" or value[-1] not in "])" or ";" not in value:
+        raise ValueError(f"Intervalle invalide : {value!r} (attendu par exemple [1;1] ou (50000;))")
+    low, high = value[1:-1].split(";", 1)
+    low = float(low) if low.strip() else -np.inf
+    high = float(high) if high.strip() else np.inf
+    return low, value[0] == "[", high, value[-1] == "]"
+
+
+class FieldCache:
+    """Source columns normalized once and shared by every rule that reads them.
+
+    Text fields are factorized: string tests run on their distinct values and
+    are broadcast back to the rows through the codes (see Condition.mask).
+    """
+
+    def __init__(self, fields, cents=()):
+        self.fields = fields
+        self.cents = set(cents)
+        self.cache = {}
+
+    def source(self, field):
+        if field not in self.fields:
+            raise ValueError(f"Champ inconnu dans les règles : {field}")
+        return self.fields[field]
+
+    def codes(self, field):
+        # Position of each row's value among the distinct values of the field (NaN included)
+        key = (field, "codes")
+        if key not in self.cache:
+            codes, uniques = pd.factorize(self.source(field), use_na_sentinel=False)
+            self.cache[key] = codes
+            self.cache[(field, "distinct")] = pd.Series(uniques, dtype=object)
+        return self.cache[key]
+
+    def get(self, field, kind):
+        """Amounts per row ("amount"), or distinct values as text ("text", upper-cased for "upper")."""
+        key = (field, kind)
+        if key not in self.cache:
+            if kind == "amount":
+                self.cache[key] = pd.to_numeric(self.source(field), errors="coerce")
+            elif kind == "text":
+                self.codes(field)
+                self.cache[key] = self.cache[(field, "distinct")].astype(str)
+            else:  # Upper-cased text for case-insensitive operators
+                self.cache[key] = self.get(field, "text").str.upper()
+        return self.cache[key]
+
+
+class Condition:
+    def __init__(self, field, operator, value, ignore_case):
+        if operator not in TEXT_OPERATORS + AMOUNT_OPERATORS:
+            raise ValueError(f"Opérateur inconnu dans les règles : {operator}")
+        self.field = field
+        self.operator = operator
+        self.ignore_case = ignore_case
+        if operator == "amount-range":
+            self.value = parse_range(value)
+            # Same bounds for amount fields given in cents (see RuleSet.evaluate)
+            low, low_closed, high, high_closed = self.value
+            self.cents_value = (low * 100 if np.isinf(low) else round(low * 100), low_closed,
+                                high * 100 if np.isinf(high) else round(high * 100), high_closed)
+        elif ignore_case and operator != "matches":
+            self.value = value.upper()
+        else:
+            self.value = value
+        # Extra literal values OR-ed into a single "contains" scan (see RuleSet.compile)
+        self.alternatives = [self.value]
+
+    def mask(self, fields):
+        if self.operator == "amount-range":
+            low, low_closed, high, high_closed = self.cents_value if self.field in fields.cents else self.value
+            amounts = fields.get(self.field, "amount")
+            above = amounts >= low if low_closed else amounts > low
+            below = amounts <= high if high_closed else amounts < high
+            return (above & below).to_numpy()
+
+        # Text tests cost one check per distinct value, whatever the number of rows
+        return self.text_mask(fields)[fields.codes(self.field)]
+
+    def text_mask(self, fields):
+        if self.operator == "matches":
+            return fields.get(self.field, "text").str.contains(self.value, case=not self.ignore_case, regex=True).to_numpy()
+
+        column = fields.get(self.field, "upper" if self.ignore_case else "text")
+        if self.operator == "equals":
+            return (column == self.value).to_numpy()
+        if self.operator == "startswith":
+            return column.str.startswith(self.value).to_numpy()
+        if len(self.alternatives) == 1:
+            return column.str.contains(self.value, regex=False).to_numpy()
+        return column.str.contains("|".join(re.escape(v) for v in self.alternatives), regex=True).to_numpy()
+
+
+class RuleSet:
+    """Ordered classification rules loaded from a CSV file.
+
+    Each line is a condition on a field. Lines sharing a non-empty `rule` id are
+    AND-ed; a line without id is a rule on its own. The first matching rule in
+    (priority, file order) gives the output.
+    """
+
+    def __init__(self, table, version):
+        self.version = version
+        self.rules = []  # (output, [conditions]) in precedence order
+
+        table = table.assign(order=range(len(table)))
+        table["priority"] = pd.to_numeric(table["priority"], errors="raise")
+        table = table.sort_values(["priority", "order"], kind="stable")
+
+        rules = {}
+        for line in table.itertuples(index=False):
+            condition = Condition(
+                line.field.strip(), line.operator.strip(), line.value,
+                line.ignore_case.strip().lower() in ("1", "true", "oui")
+            )
+            rule_id = line.rule.strip() or f"#{line.order}"
+            if rule_id not in rules:
+                rules[rule_id] = (line.output, [])
+                self.rules.append(rules[rule_id])
+            rules[rule_id][1].append(condition)
+
+        self.rules = self.compile(self.rules)
+
+    @staticmethod
+    def compile(rules):
+        # Adjacent single-condition "contains" rules on the same field with the same
+        # output are equivalent to one alternation, so a long supplier list costs
+        # one scan of the column instead of one scan per keyword
+        compiled = []
+        for output, conditions in rules:
+            if compiled and len(conditions) == 1 and conditions[0].operator == "contains":
+                last_output, last_conditions = compiled[-1]
+                condition = conditions[0]
+                if (
+                    last_output == output and len(last_conditions) == 1
+                    and last_conditions[0].operator == "contains"
+                    and last_conditions[0].field == condition.field
+                    and last_conditions[0].ignore_case == condition.ignore_case
+                ):
+                    last_conditions[0].alternatives.append(condition.value)
+                    continue
+            compiled.append((output, conditions))
+        return compiled
+
+    @classmethod
+    def from_csv(cls, data):
+        table = pd.read_csv(BytesIO(data), dtype=str, keep_default_na=False)
+        missing = [col for col in RULE_COLUMNS if col not in table.columns]
+        if missing:
+            raise ValueError(f"Colonnes manquantes dans le fichier de règles : {', '.join(missing)}")
+        return cls(table, hashlib.sha1(data).hexdigest()[:12])
+
+    def evaluate(self, fields, default=np.nan, cents=()):
+        """Return one output per row of `fields` (a DataFrame or a dict of Series).
+
+        `cents` names the amount fields given in integer cents; their ranges in
+        the rule file are still written in currency units.
+        """
+        fields = FieldCache(fields, cents)
+        masks = []
+        for output, conditions in self.rules:
+            mask = conditions[0].mask(fields)
+            for condition in conditions[1:]:
+                mask = mask & condition.mask(fields)
+            masks.append(mask)
+
+        # Resolve precedence in one step: index of the first matching rule, or the default
+        outputs = np.array([output for output, _ in self.rules] + [default], dtype=object)
+        if not masks:
+            return outputs[np.zeros(len(fields.source(next(iter(fields.fields)))), dtype=int)]
+        first_match = np.select(masks, np.arange(len(masks)), default=len(masks))
+        return outputs[first_match]
+
+
+# Parsed rule files, reloaded when the file changes on disk
+_loaded = {}
+
+
+def load_rules(name):
+    path = os.path.join(RULES_DIR, name)
+    mtime = os.path.getmtime(path)
+    cached = _loaded.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, "rb") as f:
+            cached = (mtime, RuleSet.from_csv(f.read()))
+        _loaded[path] = cached
+    return cached[1]
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+
+# One output column: where its values come from ("source", "constant" or "derived") and its dtype
+Column = namedtuple("Column", ["name", "kind", "value", "dtype"])
+
+
+def source(name, column, dtype=None):
+    """Copy of an input column."""
+    return Column(name, "source", column, dtype)
+
+
+def constant(name, value, dtype=object):
+    """Same value on every row."""
+    return Column(name, "constant", value, dtype)
+
+
+def derived(name, func, dtype=None):
+    """Computed from the input frame by func(df)."""
+    return Column(name, "derived", func, dtype)
+
+
+def project(df, layout):
+    """Build the output frame of `layout` (list of Column, in output order) in one go.
+
+    Every column is computed with its final dtype first, then the frame is
+    allocated once, instead of inserting and casting columns one at a time.
+    """
+    data = {}
+    for column in layout:
+        if column.kind == "constant":
+            values = np.full(len(df), column.value, dtype=column.dtype)
+        else:
+            values = df[column.value] if column.kind == "source" else column.value(df)
+            if column.dtype is not None:
+                values = values.astype(column.dtype)
+        data[column.name] = values
+    return pd.DataFrame(data, index=df.index)
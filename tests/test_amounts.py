@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+from amounts import cents, to_cents, with_decimals
+
+
+def test_to_cents():
+    values = pd.Series([0.1, 0.2, "12.34", 1e6 + 0.01, None, "n/a", -5.005, 734])
+    assert list(to_cents(values)) == [10, 20, 1234, 100000001, 0, 0, -500, 73400]
+    assert to_cents(values).dtype == np.int64
+
+
+def test_sums_are_exact():
+    # 0.1 + 0.2 != 0.3 in floats, but 10 + 20 == 30 in cents
+    assert to_cents(pd.Series([0.1, 0.2])).sum() == cents(0.3)
+
+
+def test_with_decimals():
+    df = pd.DataFrame({"DEBIT": [1234, 0], "CREDIT": [0, 5], "LIB": ["a", "b"]})
+    out = with_decimals(df, ["DEBIT", "CREDIT"])
+    assert out["DEBIT"].tolist() == [12.34, 0.0] and out["CREDIT"].tolist() == [0.0, 0.05]
+    assert df["DEBIT"].tolist() == [1234, 0]
@@ -0,0 +1,60 @@
+import hashlib
+import pandas as pd
+import streamlit as st
+from cache import ResultCache, content_key, result_size, upload_digest
+
+
+class Upload:
+    def __init__(self, file_id, data):
+        self.file_id = file_id
+        self.data = data
+        self.reads = 0
+
+    def getvalue(self):
+        self.reads += 1
+        return self.data
+
+
+def test_content_key():
+    digest = hashlib.sha256(b"xlsx").hexdigest()
+    assert content_key("BANQUE", b"xlsx", "v1") == ("BANQUE", digest, "v1")
+    assert content_key("BANQUE", digest, "v1") == content_key("BANQUE", b"xlsx", "v1")
+
+
+def test_upload_hashed_once_per_file_id(monkeypatch):
+    monkeypatch.setattr(st, "session_state", {})
+    upload = Upload("id-1", b"xlsx")
+    assert upload_digest(upload) == hashlib.sha256(b"xlsx").hexdigest()
+    upload_digest(upload)
+    assert upload.reads == 1
+    upload_digest(Upload("id-2", b"xlsx"))
+    assert len(st.session_state["uploads"]) == 2
+
+
+def test_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2, max_bytes=100)
+    cache.put("a", b"1" * 10)
+    cache.put("b", b"2" * 10)
+    cache.get("a")
+    cache.put("c", b"3" * 10)
+    assert list(cache.entries) == ["a", "c"]
+
+    # Over the byte limit: oldest out until it fits, too big values not kept
+    cache.put("d", b"4" * 95)
+    assert list(cache.entries) == ["d"] and cache.total_bytes == 95
+    cache.put("e", b"5" * 101)
+    assert cache.get("e") is None and cache.total_bytes == 95
+
+
+def test_get_or_compute():
+    cache = ResultCache()
+    calls = []
+    compute = lambda: calls.append(1) or (b"out", 3)
+    assert cache.get_or_compute("k", compute) == (b"out", 3)
+    assert cache.get_or_compute("k", compute) == (b"out", 3)
+    assert len(calls) == 1
+
+
+def test_result_size():
+    df = pd.DataFrame({"a": [1, 2]})
+    assert result_size((b"abc", [df, None])) == 3 + int(df.memory_usage(deep=True).sum())
@@ -0,0 +1,55 @@
+import datetime as dt
+import numpy as np
+import pandas as pd
+from dates import format_dates, to_dates
+
+
+def test_mixed_serials_text_and_datetimes():
+    values = pd.Series([
+        45323,                           # Excel serial of 01/02/2024
+        45323.5,                         # with a time
+        "13/02/2024",
+        " 14/02/2024 ",
+        "2024-02-15",
+        dt.datetime(2024, 2, 16, 8, 30),
+        dt.date(2024, 2, 17),
+        pd.Timestamp("2024-02-18"),
+        None,
+        np.nan,
+        "",
+        "pas une date",
+        0,                               # outside the Excel range
+        True,
+    ], dtype=object)
+    expected = [pd.Timestamp(text) for text in [
+        "2024-02-01", "2024-02-01 12:00", "2024-02-13", "2024-02-14", "2024-02-15",
+        "2024-02-16 08:30", "2024-02-17", "2024-02-18",
+    ]] + [pd.NaT] * 6
+    dates = to_dates(values)
+    assert dates.dtype == "datetime64[ns]"
+    assert dates.iloc[:8].tolist() == expected[:8]
+    assert dates.iloc[8:].isna().all()
+
+
+def test_day_first_unless_the_column_says_otherwise():
+    # Every text fits dd/mm and mm/dd: French statements are day first
+    assert list(to_dates(pd.Series(["03/04/2024", "05/04/2024"]))) == list(pd.to_datetime(["2024-04-03", "2024-04-05"]))
+    # 04/13 cannot be day first, so the whole column of this shape is month first
+    assert list(to_dates(pd.Series(["03/04/2024", "04/13/2024"]))) == list(pd.to_datetime(["2024-03-04", "2024-04-13"]))
+
+
+def test_result_does_not_depend_on_earlier_calls():
+    to_dates(pd.Series(["04/13/2024"]))
+    assert to_dates(pd.Series(["03/04/2024"]))[0] == pd.Timestamp("2024-04-03")
+
+
+def test_repeated_values_and_index_kept():
+    values = pd.Series(["01/02/2024", 45323, "01/02/2024", None], index=[10, 11, 12, 13], dtype=object)
+    dates = to_dates(values)
+    assert list(dates.index) == [10, 11, 12, 13]
+    assert list(format_dates(dates)) == ["01/02/2024", "01/02/2024", "01/02/2024", np.nan]
+
+
+def test_datetime_column_unchanged():
+    values = pd.Series(pd.to_datetime(["2024-02-01 10:00", None]))
+    assert to_dates(values) is values
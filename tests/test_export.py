@@ -0,0 +1,60 @@
+import io
+import gzip
+import numpy as np
+import pandas as pd
+import pytest
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+import export
+from export import CSV, PARQUET, CsvOptions
+
+# BANQUE-like table: TIERS mixes text and numeric codes, amounts have decimals
+TABLE = pd.DataFrame({
+    "DATE": pd.to_datetime(["2024-01-02", "2024-01-03", "2024-01-04"]),
+    "TIERS": ["ACME", 4411, None],
+    "CPT": pd.array([6331000000, None, 4411000000], dtype="Int64"),
+    "DEBIT": [12.5, 0.0, 1000.25],
+})
+
+
+def download(data, file_name):
+    # What Streamlit does when the button is clicked: run the callable in its media manager
+    storage = MemoryMediaFileStorage("/media")
+    manager = MediaFileManager(storage)
+    file_id = manager.add_deferred(data, None, "test", file_name)
+    url = manager.execute_deferred(file_id)
+    return storage.get_file(url.rsplit("/", 1)[-1].split(".")[0]).content
+
+
+def test_csv_download():
+    options = CsvOptions(";", ",", "cp1252", False)
+    content = download(lambda: export.convert(TABLE, CSV, options, "%d/%m/%Y"), "table.csv")
+    lines = content.decode("cp1252").splitlines()
+    assert lines[0] == "DATE;TIERS;CPT;DEBIT"
+    assert lines[1] == "02/01/2024;ACME;6331000000;12,5"
+    assert lines[3] == "04/01/2024;;4411000000;1000,25"
+
+
+def test_csv_gzip_chunks(monkeypatch):
+    monkeypatch.setattr(export, "CHUNK_ROWS", 2)
+    options = CsvOptions(",", ".", "utf-8", True)
+    content = download(lambda: export.convert(TABLE, CSV, options), "table.csv.gz")
+    lines = gzip.decompress(content).decode().splitlines()
+    assert len(lines) == len(TABLE) + 1
+    assert lines[0] == "DATE,TIERS,CPT,DEBIT"
+
+
+def test_parquet_download_mixed_types(monkeypatch):
+    pytest.importorskip("pyarrow")
+    monkeypatch.setattr(export, "CHUNK_ROWS", 2)
+    content = download(lambda: export.convert(TABLE, PARQUET), "table.parquet")
+    table = pd.read_parquet(io.BytesIO(content))
+    assert table["TIERS"].tolist() == ["ACME", "4411", None]
+    assert table["DATE"].tolist() == TABLE["DATE"].tolist()
+    np.testing.assert_array_equal(table["DEBIT"], TABLE["DEBIT"])
+
+
+def test_download_table_checks_parquet_engine(monkeypatch):
+    monkeypatch.setattr(export, "parquet_available", lambda: False)
+    with pytest.raises(export.ExportError):
+        export.download_table(TABLE, "table", PARQUET)
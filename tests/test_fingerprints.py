@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import bq_ref
+import fingerprints
+from bench.generate import generate_reference
+from fingerprints import CHUNK_SIZE, FingerprintStore, row_fingerprints
+
+
+def test_fingerprints_by_text_and_version():
+    fields = {"A": pd.Series([1, 2, 1]), "B": pd.Series(["x", "y", "x"])}
+    same = row_fingerprints(fields, "v1")
+    assert same[0] == same[2] and same[0] != same[1]
+    assert list(row_fingerprints({"A": pd.Series(["1", "2", "1"]), "B": fields["B"]}, "v1")) == list(same)
+    assert row_fingerprints(fields, "v2")[0] != same[0]
+
+
+def test_store_round_trip(tmp_path):
+    store = FingerprintStore(str(tmp_path / "store.db"), "banque", ["TIERS", "CPT"])
+    keys = np.arange(-5, CHUNK_SIZE + 5, dtype=np.int64)
+    store.save(keys[::2], pd.DataFrame({"TIERS": ["T"] * len(keys[::2]), "CPT": np.nan}))
+    found = store.lookup(np.r_[keys, keys[:1]])
+    assert found["known"].tolist() == [i % 2 == 0 for i in range(len(keys))] + [True]
+    assert found.loc[found["known"], "TIERS"].eq("T").all()
+    assert found.loc[found["known"], "CPT"].isna().all()
+
+
+def test_incremental_refs_match_full_run(tmp_path, monkeypatch):
+    df, original_refs = bq_ref.read_reference(generate_reference(1000, 2000))
+    expected = bq_ref.classify_refs(df, original_refs)
+
+    monkeypatch.setattr(fingerprints, "STORE_PATH", str(tmp_path / "store.db"))
+    monkeypatch.setattr(fingerprints, "_stores", {})
+    # First half stored, then the whole statement with half of its rows known
+    half = len(df) // 2
+    assert list(bq_ref.classify_refs(df[:half], original_refs[:half])) == list(expected[:half])
+    assert list(bq_ref.classify_refs(df, original_refs)) == list(expected)
+    assert "reference" in fingerprints._stores
@@ -0,0 +1,59 @@
+import datetime as dt
+import pandas as pd
+import xlsxwriter
+from io import BytesIO
+from ingest import read_workbook, sheet_digest
+
+
+def workbook(sheets):
+    # .xlsx with shared strings, as saved by Excel; sheets is a list of (name, rows)
+    output = BytesIO()
+    wb = xlsxwriter.Workbook(output)
+    date_format = wb.add_format({"num_format": "dd/mm/yyyy"})
+    for name, rows in sheets:
+        ws = wb.add_worksheet(name)
+        for row_idx, row in enumerate(rows):
+            for col_idx, value in enumerate(row):
+                if isinstance(value, dt.datetime):
+                    ws.write_datetime(row_idx, col_idx, value, date_format)
+                elif value is not None:
+                    ws.write(row_idx, col_idx, value)
+    wb.close()
+    return output
+
+
+STATEMENT = [
+    [dt.datetime(2024, 1, 2), "VIR", "ORANGE", None, 10.5, None],
+    [dt.datetime(2024, 1, 3), "CHQ", "MAMDA", "FAC", None, 20],
+    [None, None, None, None, None, None],
+    ["03/01/2024", "FRAIS", 123, "", 1.25, None],
+]
+MAPPINGS = [["ORANGE", "T_ORANGE"], ["MAMDA", "T_MAMDA"]]
+
+
+def test_same_frames_as_read_excel():
+    file = workbook([("Releve", STATEMENT), ("Mappings", MAPPINGS)])
+    data = read_workbook(file, sheets=[0, "Mappings", 5, "Absente"])
+    assert data.sheet_names == ["Releve", "Mappings"]
+    assert list(data.frames) == [0, "Mappings"]
+    for key in (0, "Mappings"):
+        file.seek(0)
+        pd.testing.assert_frame_equal(data.frames[key], pd.read_excel(file, sheet_name=key, header=None))
+
+
+def test_max_rows():
+    file = workbook([("Releve", STATEMENT), ("Mappings", MAPPINGS)])
+    data = read_workbook(file, sheets=[0, 1], max_rows={0: 2})
+    assert len(data.frames[0]) == 2
+    assert len(data.frames[1]) == 2
+
+
+def test_sheet_digest_only_depends_on_the_sheet():
+    digest = sheet_digest(workbook([("Releve", STATEMENT), ("Mappings", MAPPINGS)]), 1)
+    # Other first sheet, so other shared-string indexes for the same mappings
+    other = [["ZZZ", "MAMDA", "T_ORANGE", 1]]
+    assert sheet_digest(workbook([("Autre", other), ("Mappings", MAPPINGS)]), 1) == digest
+    changed = [["ORANGE", "T_ORANGE"], ["MAMDA", "T_MAMDA 2"]]
+    assert sheet_digest(workbook([("Releve", STATEMENT), ("Mappings", changed)]), 1) != digest
+    assert sheet_digest(workbook([("Releve", STATEMENT)]), 1) is None
+    assert sheet_digest(BytesIO(b"pas un zip"), 0) is None
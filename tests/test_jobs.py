@@ -0,0 +1,102 @@
+import uuid
+import threading
+import pytest
+import streamlit as st
+import jobs
+from jobs import CANCELLED, DONE, JobQueue, run_job
+from timing import stage
+
+
+class Rerun(Exception):
+    pass
+
+
+@pytest.fixture
+def page(monkeypatch):
+    """Streamlit calls of run_job on a plain session dict; `clicks` names the buttons pressed."""
+    clicks = set()
+    monkeypatch.setattr(st, "session_state", {})
+    monkeypatch.setattr(st, "button", lambda label: label in clicks)
+    monkeypatch.setattr(st, "progress", lambda *args, **kwargs: None)
+    monkeypatch.setattr(st, "warning", lambda *args: None)
+    monkeypatch.setattr(st, "rerun", lambda: (_ for _ in ()).throw(Rerun()))
+    monkeypatch.setattr(jobs, "POLL_SECONDS", 0)
+    monkeypatch.setattr(jobs, "JOBS", JobQueue(1))
+    return clicks
+
+
+def poll(key, compute):
+    # Reruns of the page until the job gives a result
+    for _ in range(1000):
+        try:
+            return run_job("TEST", key, compute, ["read", "write"])
+        except Rerun:
+            pass
+    raise AssertionError("job still running")
+
+
+def test_result_then_attached_to_the_session(page):
+    key = ("TEST", uuid.uuid4().hex)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        with stage("read", 10):
+            pass
+        with stage("write"):
+            pass
+        return b"out"
+
+    result, profile = poll(key, compute)
+    assert result == b"out" and [record["stage"] for record in profile.stages] == ["read", "write"]
+    assert run_job("TEST", key, compute, []) == (result, profile)
+    assert len(calls) == 1
+
+
+def test_failed_job_not_rerun_until_restart(page):
+    key = ("TEST", uuid.uuid4().hex)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        raise ValueError("colonnes manquantes")
+
+    with pytest.raises(ValueError):
+        poll(key, compute)
+    with pytest.raises(ValueError):
+        run_job("TEST", key, compute, [])
+    assert len(calls) == 1
+
+    page.add("Relancer le traitement")
+    with pytest.raises(ValueError):
+        poll(key, compute)
+    assert len(calls) == 2
+
+
+def test_same_key_shares_one_job_and_cancel_stops_it():
+    queue = JobQueue(1)
+    started, release = threading.Event(), threading.Event()
+
+    def compute():
+        with stage("read"):
+            started.set()
+            release.wait(5)
+        with stage("write"):
+            pass
+        return b"out"
+
+    key = ("TEST", uuid.uuid4().hex)
+    job = queue.submit("TEST", key, compute, ["read", "write"], "session-1")
+    assert queue.submit("TEST", key, compute, ["read", "write"], "session-2") is job
+    started.wait(5)
+    job.release("session-1")
+    assert not job.cancelled.is_set()
+    job.release("session-2")
+    release.set()
+    job.future.result(5)
+    assert job.state == CANCELLED and job.result is None
+
+    # Cancelled jobs are replaced when the key is submitted again
+    again = queue.submit("TEST", key, lambda: b"out", ["read", "write"], "session-1")
+    again.future.result(5)
+    assert again is not job and again.state == DONE and again.result == b"out"
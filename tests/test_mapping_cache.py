@@ -0,0 +1,42 @@
+import os
+import pandas as pd
+import mapping_cache
+from mapping_cache import MappingCache
+
+MAPPINGS = pd.DataFrame({0: ["ORANGE", "MAMDA"], 1: ["T_ORANGE", "T_MAMDA"]})
+
+
+def test_compile_once_and_reload(tmp_path):
+    cache = MappingCache(str(tmp_path))
+    first = cache.compile(MAPPINGS, alias="digest-1")
+    assert cache.compile(MAPPINGS.copy()) is first
+    assert cache.by_alias("digest-1") is first
+    assert cache.by_alias("digest-2") is None
+    assert cache.latest() is first
+
+    # A new process (or server restart) loads the stored pickle
+    restarted = MappingCache(str(tmp_path))
+    loaded = restarted.by_alias("digest-1")
+    assert loaded is not first and loaded.version == first.version
+    assert loaded.find("orange") == first.find("orange") == "T_ORANGE"
+
+
+def test_latest_is_the_last_compiled(tmp_path):
+    cache = MappingCache(str(tmp_path))
+    cache.compile(MAPPINGS)
+    other = cache.compile(pd.DataFrame({0: ["KITEA"], 1: ["T_KITEA"]}))
+    assert cache.latest_version() == other.version
+    assert MappingCache(str(tmp_path)).latest().version == other.version
+
+
+def test_memory_bounded_and_corrupt_files_ignored(tmp_path, monkeypatch):
+    monkeypatch.setattr(mapping_cache, "MAX_LOADED", 2)
+    cache = MappingCache(str(tmp_path))
+    versions = [cache.compile(pd.DataFrame({0: [f"K{i}"], 1: [f"V{i}"]})).version for i in range(3)]
+    assert list(cache.loaded) == versions[1:]
+    assert cache.load(versions[0]).version == versions[0]
+
+    with open(os.path.join(str(tmp_path), "bad.pickle"), "wb") as f:
+        f.write(b"pas un pickle")
+    assert cache.load("bad") is None
+    assert cache.load("absent") is None
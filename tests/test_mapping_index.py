@@ -0,0 +1,70 @@
+import pickle
+import numpy as np
+import mapping_index
+from mapping_index import MappingIndex, key_grams
+
+KEYS = ["STE ORANGE 00001 SARL", "STE MAMDA 00002 SARL", "ORANGE MAROC", "STE ONSSA 00003 SARL",
+        "STE CARREFOUR 00004 SARL", "STE ORANGE 00005 SARL", "KITEA"]
+VALUES = ["T_ORANGE", "T_MAMDA", "T_ORANGE", "T_ONSSA", "T_CARREFOUR", "T_ORANGE 5", np.nan]
+
+
+def dice(a, b):
+    a, b = key_grams(a.lower()), key_grams(b.lower())
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def brute_force(tier, k, min_score, common=()):
+    # Keys sharing an uncommon trigram scored, best first then sheet order, one entry per TIERS
+    grams = key_grams(tier.lower()) - set(common)
+    candidates = [pos for pos in range(len(KEYS)) if grams & key_grams(KEYS[pos].lower())]
+    ranked = sorted(candidates, key=lambda pos: (-dice(tier, KEYS[pos]), pos))
+    suggestions = []
+    for pos in ranked:
+        score = dice(tier, KEYS[pos])
+        if score < min_score or len(suggestions) == k:
+            break
+        if VALUES[pos] == VALUES[pos] and VALUES[pos] not in [value for value, _ in suggestions]:
+            suggestions.append((VALUES[pos], round(score, 2)))
+    return suggestions
+
+
+def test_find_first_match_in_sheet_order():
+    index = MappingIndex(KEYS, VALUES)
+    assert index.find("orange") == "T_ORANGE"
+    assert index.find("00005") == "T_ORANGE 5"
+    assert index.find("ma") == "T_MAMDA"
+    assert np.isnan(index.find("inconnu"))
+
+
+def test_suggest_matches_dice_ranking(monkeypatch):
+    # Every trigram in over 2 keys counts as common, so both candidate paths are used
+    monkeypatch.setattr(mapping_index, "COMMON_GRAM_KEYS", 2)
+    monkeypatch.setattr(mapping_index, "COMMON_GRAM_SHARE", 0.0)
+    index = MappingIndex(KEYS, VALUES)
+    assert index.common
+    for tier in ["orange 00001", "ste mamda sarl", "carrefour market", "kitea"]:
+        assert index.suggest(tier, 3, 0.2) == brute_force(tier, 3, 0.2, index.common)
+    # Keys sharing only common trigrams ("ste", "sarl") are not candidates
+    assert index.suggest("ste sarl", 3) == []
+
+
+def test_suggest_small_index_scores_every_key():
+    index = MappingIndex(KEYS, VALUES)
+    assert not index.common
+    for tier in ["orange 00001", "ste mamda sarl", "carrefour market"]:
+        assert index.suggest(tier, 3, 0.2) == brute_force(tier, 3, 0.2)
+
+
+def test_suggest_min_score():
+    index = MappingIndex(KEYS, VALUES)
+    assert index.suggest("orange", 3, 0.0)
+    assert all(score >= 0.3 for _, score in index.suggest("orange", 3, 0.3))
+    assert index.suggest("xyz", 3) == []
+
+
+def test_pickle_round_trip():
+    index = MappingIndex(KEYS, VALUES)
+    index.find("orange")
+    copy = pickle.loads(pickle.dumps(index))
+    assert copy.suggest("orange maroc", 2) == index.suggest("orange maroc", 2)
+    assert np.isnan(copy.find("kitea"))
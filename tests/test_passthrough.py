@@ -0,0 +1,77 @@
+import io
+import zipfile
+import datetime as dt
+import openpyxl
+import pytest
+import xlsxwriter
+import bq_ref
+from export import unique_sheet_name
+from passthrough import PassthroughError, copy_sheet
+
+STATEMENT = [
+    [dt.datetime(2024, 1, 2), "AWB", "VIREMENT EMIS", "ORANGE", "", 120.5, 0],
+    [dt.datetime(2024, 1, 3), "AWB", "COMMISSION", "AWB", "FRAIS", 15, 0],
+]
+
+
+def upload(second_name, second_rows):
+    # Reference upload laid out like Excel saves it: one shared-strings table and styles for both sheets
+    output = io.BytesIO()
+    workbook = xlsxwriter.Workbook(output)
+    bold = workbook.add_format({"bold": True})
+    date = workbook.add_format({"num_format": "dd/mm/yyyy"})
+    statement = workbook.add_worksheet("Releve")
+    for row_idx, row in enumerate(STATEMENT):
+        statement.write_datetime(row_idx, 0, row[0], date)
+        statement.write_row(row_idx, 1, row[1:])
+    sheet = workbook.add_worksheet(second_name)
+    for row_idx, row in enumerate(second_rows):
+        for col_idx, value in enumerate(row):
+            if isinstance(value, dt.datetime):
+                sheet.write_datetime(row_idx, col_idx, value, date)
+            elif value is not None:
+                sheet.write(row_idx, col_idx, value, bold if (row_idx, col_idx) == (0, 0) else None)
+    workbook.close()
+    output.seek(0)
+    return output
+
+
+def reopen(output):
+    return openpyxl.load_workbook(io.BytesIO(output))
+
+
+def test_copied_sheet_keeps_values_and_formats():
+    rows = [["STE ORANGE SARL", "T_ORANGE", None], ["AWB", 4411, dt.datetime(2024, 5, 1)]]
+    output = bq_ref.process(upload("Mappings", rows)).output
+
+    workbook = reopen(output)
+    assert workbook.sheetnames == ["Processed", "Mappings"]
+    sheet = workbook["Mappings"]
+    assert [list(row) for row in sheet.iter_rows(values_only=True)] == rows
+    assert sheet["A1"].font.bold
+    assert sheet["C2"].number_format == "dd/mm/yyyy"
+    assert workbook["Processed"]["D2"].value == "FRAIS"
+
+
+def test_duplicate_sheet_name_is_renamed():
+    output = bq_ref.process(upload("processed", [["a", "b"]])).output
+
+    workbook = reopen(output)
+    assert workbook.sheetnames == ["Processed", "processed1"]
+    assert workbook["processed1"]["B1"].value == "b"
+    with zipfile.ZipFile(io.BytesIO(output)) as archive:
+        app_xml = archive.read("docProps/app.xml").decode()
+    assert "<vt:i4>2</vt:i4>" in app_xml
+    assert "<vt:lpstr>Processed</vt:lpstr><vt:lpstr>processed1</vt:lpstr>" in app_xml
+
+
+def test_output_with_shared_strings_is_refused():
+    with pytest.raises(PassthroughError):
+        copy_sheet(upload("Mappings", [["a"]]).getvalue(), upload("Mappings", [["a"]]), 1)
+
+
+def test_unique_sheet_name():
+    assert unique_sheet_name("Mappings", ["Processed"]) == "Mappings"
+    assert unique_sheet_name("PROCESSED", ["Processed", "processed1"]) == "PROCESSED2"
+    long_name = "x" * 31
+    assert unique_sheet_name(long_name, [long_name]) == "x" * 30 + "1"
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+from rollup import DETAIL, SUBTOTAL, TOTAL, rollup
+
+ROWS = pd.DataFrame({
+    "CPT": [4411000000, 3421000000, 4411000000, np.nan, 4411000000, 3421000000, np.nan],
+    "LIB": ["b", "a", "a", "x", "b", "a", "y"],
+    "DEBIT": [100, 250, 5, 7, 1, 3, 11],
+    "CREDIT": [0, 10, 0, 0, 20, 0, 4],
+})
+
+
+def expected_rows(df, group, detail, values, missing_label, total_label, grand_total):
+    # The groups one at a time, as the pivots were built before rollup
+    rows = []
+    present = df[df[group].notna()]
+    for name, details in present.groupby(group, sort=True):
+        for lib, amounts in details.groupby(detail, sort=True):
+            rows.append([name, lib] + [amounts[v].sum() for v in values])
+        rows.append([name, total_label] + [details[v].sum() for v in values])
+    missing = df[df[group].isna()]
+    if len(missing):
+        for lib, amounts in missing.groupby(detail, sort=True):
+            rows.append([missing_label, lib] + [amounts[v].sum() for v in values])
+        rows.append([missing_label, total_label] + [missing[v].sum() for v in values])
+    if grand_total:
+        rows.append([total_label, ""] + [df[v].sum() for v in values])
+    return rows
+
+
+def test_order_subtotals_and_grand_total():
+    result = rollup(ROWS, "CPT", "LIB", ["DEBIT", "CREDIT"])
+    assert result.frame.values.tolist() == expected_rows(ROWS, "CPT", "LIB", ["DEBIT", "CREDIT"], "Vide", "Total", True)
+    assert list(result.kinds) == [DETAIL, SUBTOTAL, DETAIL, DETAIL, SUBTOTAL, DETAIL, DETAIL, SUBTOTAL, TOTAL]
+    assert list(result.missing) == [False] * 5 + [True] * 3 + [False]
+    assert result.frame["DEBIT"].dtype == np.int64
+
+
+def test_without_grand_total_or_empty_group():
+    df = ROWS[ROWS["CPT"].notna()]
+    result = rollup(df, "CPT", "LIB", ["DEBIT"], grand_total=False)
+    assert result.frame.values.tolist() == expected_rows(df, "CPT", "LIB", ["DEBIT"], "Vide", "Total", False)
+    assert not result.missing.any()
+
+
+def test_empty_frame():
+    result = rollup(ROWS.iloc[:0], "CPT", "LIB", ["DEBIT", "CREDIT"])
+    assert result.frame.values.tolist() == [["Total", "", 0, 0]]
+    assert list(result.kinds) == [TOTAL]
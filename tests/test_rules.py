@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+import pytest
+import bq
+import bq_ref
+import mapping_cache
+from bench.generate import generate_bank, generate_reference
+from rules import RuleSet
+
+# Keywords of the original if/elif chains (before rules/*.csv)
+CPT_TIERS = ["AJYAD", "ASWAK", "ATTIJARI", "AUTOROUTE", "BIOCI", "BOIS", "BOUNMER", "BRICO", "CABINET", "CARREF",
+             "consilia", "conseil", "da graph", "deco new", "durofloor", "electroplanet", "environnement", "FOURNI",
+             "BAZAS", "globus", "hamri tissus", "ideal", "inwi", "incendie", "khadamat", "kitea", "KPA", "lab", "lvs",
+             "MAMDA", "MARAHIL", "marjan", "ministre", "MOGES", "MUST", "ORANGE", "PLANEX", "pneumatique", "PRINT",
+             "REDAL", "relanc", "REFRI", "SANITAIRE", "secola", "SMURF", "smpce", "SOLUTIONS", "STARDEC", "TEMARA",
+             "trois", "WAFABAIL", "intra", "abcr", "boulon", "bmj", "Khadamat", "TRANS", "AFROUKH", "onssa", "ZIMBA",
+             "STORES", "GOLD", "COMPLEX", "LEGNO", "TISSUS", "DAKAR", "PROJET", "D.A"]
+FELAH_NAMES = ["hamza", "youssef", "abdellah", "yousef", "rachid", "majdoubi", "touhami", "bikri", "bouzidi", "brahim",
+               "derouach", "hatta", "benda", "khalid", "amine", "hamid", "mohammed", "mohamed", "sliman", "benbo",
+               "dkhail", "charrad", "bouzid", "lehcen", "acha", "akil", "benz", "hassan", "hadri", "kharmo", "jilali",
+               "houcin", "fellaha", "miloud", "asmaa", "bouchta", "ahmed", "afroukh", "znagui"]
+FAC_NAMES = ["orange", "mamda", "onssa", "aswak", "brico", "carref", "wafabail", "cabinet", "trans", "redal", "refri",
+             "secola", "dakar", "attijari", "temara", "kpa", "easy", "ajyad", "bioci", "must", "saidou", "bounmer",
+             "pharmaci", "boutiq", "print", "moges", "fourni", "bois", "planex", "smurf", "asswak", "autor", "omnium",
+             "dakkar", "idealalu", "deco new", "abcr", "azrou complexes", "da graph", "durofloor", "tissus",
+             "electroplanet", "forges de bazas", "globus", "environnement", "lab", "intra", "inwi", "khadamat", "kitea",
+             "trois", "lvs", "marjan", "ministre", "muneris", "consilia", "ola", "conseil", "pneumatique", "incendie",
+             "sanitaire", "smpce", "star dec", "boulon"]
+
+
+def original_cpt(raw_df):
+    # CPT as computed by the page before the rules engine, amounts in decimals
+    tier = raw_df["RAW_TIER"].astype(str).str.upper()
+    ref = raw_df["RAW_REF"]
+    conditions = [
+        raw_df["CA"] == 1,
+        tier.str.startswith("FRUL", na=False),
+        ref.astype(str).str.upper().str.startswith("CONGÉ", na=False) | (ref == "PAIE"),
+        (tier == "CNSS") | (ref == "COTIS"),
+        (ref == "FRAIS") | raw_df["RAW_LIB"].astype(str).str.upper().str.startswith("FRAIS", na=False),
+        ref == "PERTE",
+        ref == "GAIN",
+        (ref == "FELAH") | raw_df["TIERS"].astype(str).str.contains("|".join(CPT_TIERS), case=False, na=False),
+        ref == "IR",
+        ref == "RETENU MEDECIN",
+        ref == "RETENU AVOCAT",
+        tier.str.contains("SAIDOU", na=False),
+        tier.str.contains("VIGNETTE", na=False),
+        tier.str.contains("CAISSE", na=False),
+    ]
+    choices = [3497000000, 3421000000, 4432000000, 4441000000, 6147300000, 6331000000, 7331000000, 4411000000,
+               4452500000, 4458110100, 4458110200, 4411000000, 4452110000, 5115000000]
+    return np.select(conditions, choices, default=np.nan).astype(float)
+
+
+def original_ref(raw_tier, raw_lib, raw_ref, debit, credit):
+    # REF of one row with an empty original REF, as the page's if/elif chain gave it
+    if any(name in raw_tier for name in FELAH_NAMES):
+        return "FELAH"
+    if any(name in raw_tier for name in FAC_NAMES):
+        return "FAC"
+    if any(kw in raw_lib or kw in raw_tier for kw in ["frais", "commis", "pmeplus"]):
+        return "FRAIS"
+    if raw_tier == "cnss":
+        return "COTIS"
+    if "salaire" in raw_tier or "cong" in raw_ref or "ettoumy" in raw_tier:
+        return "PAIE"
+    if "relanc" in raw_tier:
+        return "REMB"
+    if raw_tier == "dgi" and debit > 50000:
+        return "IR"
+    if "change" in raw_lib:
+        return "PERTE" if debit > credit else "GAIN"
+    return ""
+
+
+@pytest.fixture(autouse=True)
+def mapping_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(mapping_cache.MAPPINGS, "directory", str(tmp_path))
+
+
+def test_cpt_rules_match_original_chain():
+    raw_df, mapping_index = bq.read_statement(generate_bank(1000, 2000))
+    raw_df = bq.prepare(raw_df)
+    raw_df["TIERS"] = bq.assign_tiers(raw_df, mapping_index)
+    expected = original_cpt(raw_df.assign(DEBIT=raw_df["DEBIT"] / 100, CREDIT=raw_df["CREDIT"] / 100))
+    assert len(np.unique(expected[~np.isnan(expected)])) > 5
+    np.testing.assert_array_equal(bq.classify(raw_df), expected)
+
+
+def test_ref_rules_match_original_chain():
+    df, original_refs = bq_ref.read_reference(generate_reference(1000, 2000))
+    # Edge rows: IR threshold, change with equal amounts, accents
+    edge = pd.DataFrame({
+        "DATE": None, "RAW_LIB": ["virement", "virement", "change devise", "frais"],
+        "RAW_TIER": ["dgi", "dgi", "x", "congé"], "RAW_REF": ["", "", "", "congé"],
+        "DEBIT": [50000.0, 50000.01, 10.0, np.nan], "CREDIT": [0.0, 0.0, 10.0, 5.0],
+    })
+    df = pd.concat([df, edge.astype({"DATE": df["DATE"].dtype})], ignore_index=True)
+    original_refs = pd.concat([original_refs, pd.Series([""] * len(edge))], ignore_index=True)
+
+    expected = [
+        kept if kept != "" else original_ref(tier, lib, ref, 0 if pd.isna(debit) else float(debit),
+                                             0 if pd.isna(credit) else float(credit))
+        for kept, tier, lib, ref, debit, credit in zip(
+            original_refs, df["RAW_TIER"], df["RAW_LIB"], df["RAW_REF"], df["DEBIT"], df["CREDIT"])
+    ]
+    assert set(expected) >= {"FELAH", "FAC", "FRAIS", "IR", "GAIN"}
+    assert list(bq_ref.classify_refs(df, original_refs)) == expected
+
+
+def test_priority_and_case():
+    rules = RuleSet.from_csv((
+        "rule,priority,field,operator,value,ignore_case,output\n"
+        ",20,NAME,contains,acme,1,LATE\n"
+        ",10,NAME,equals,ACME SA,0,FIRST\n"
+        "both,30,NAME,startswith,z,1,BOTH\n"
+        "both,30,AMOUNT,amount-range,[100;),,BOTH\n"
+    ).encode())
+    fields = {"NAME": pd.Series(["ACME SA", "acme sa", "Zed", "zed", None]),
+              "AMOUNT": pd.Series([0, 0, 15000, 9999, 0])}  # cents
+    assert list(rules.evaluate(fields, default="", cents=["AMOUNT"])) == ["FIRST", "LATE", "BOTH", "", ""]
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import achats
+from bench.generate import generate_purchases
+from dates import to_dates
+from schema import constant, derived, project, source
+
+
+def test_project_order_and_types():
+    df = pd.DataFrame({0: ["1", "2"], 1: ["a", "b"]}, index=[5, 6])
+    out = project(df, [
+        derived("AB", lambda df: df[1] + df[0]),
+        constant("ZERO", 0, "int64"),
+        source("N", 0, float),
+        constant("EMPTY", ""),
+    ])
+    assert list(out.columns) == ["AB", "ZERO", "N", "EMPTY"]
+    assert list(out.index) == [5, 6]
+    assert out.dtypes.tolist() == [object, np.int64, float, object]
+    assert out.values.tolist() == [["a1", 0, 1.0, ""], ["b2", 0, 2.0, ""]]
+
+
+def test_achats_layout_matches_column_by_column_build():
+    raw = achats.read_purchases(generate_purchases(500))
+    # The import frame as the page built it before the layout, one column at a time
+    expected = pd.DataFrame()
+    expected["Date"] = to_dates(raw[0])
+    expected["N FAC"] = ""
+    expected["TIERS"] = raw[4].astype(str) + "."
+    expected["IF"] = ""
+    expected["ICE"] = ""
+    expected["DESIGNATION"] = (raw[3] + " / " + raw[4]).astype(str)
+    expected["TTC"] = raw[8].astype(float)
+    expected["HT"] = raw[8].astype(float)
+    expected["TVA"] = 0
+    expected["MODE REGL"] = ""
+    expected["DATE REGL"] = ""
+    expected["CPT HT"] = 6111000000
+    expected["CPT TVA"] = 0
+    expected["TAUX TVA"] = ""
+    expected["JOURNAL TRESORIE"] = ""
+    pd.testing.assert_frame_equal(project(raw, achats.ACHATS_LAYOUT), expected)
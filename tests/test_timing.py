@@ -0,0 +1,49 @@
+import threading
+from timing import Profile, profiling, stage
+
+
+def test_stages_recorded_inside_profiling():
+    with profiling("TEST", trace_memory=True) as profile:
+        with stage("read") as record:
+            record["rows"] = 3
+        with stage("write", 3):
+            data = [0] * 100_000
+    assert [record["stage"] for record in profile.stages] == ["read", "write"]
+    assert [record["rows"] for record in profile.stages] == [3, 3]
+    assert all(record["seconds"] >= 0 for record in profile.stages)
+    assert profile.stages[1]["peak_traced_mb"] >= 0.8
+    assert list(profile.as_frame()["stage"]) == ["read", "write"]
+    del data
+
+
+def test_stage_outside_profiling_does_nothing():
+    with stage("read") as record:
+        record["rows"] = 1
+    assert record == {"rows": 1}
+
+
+def test_profiles_of_other_threads_stay_separate():
+    profiles = {}
+
+    def run(name):
+        with profiling(name, trace_memory=False) as profile:
+            with stage(name):
+                pass
+        profiles[name] = profile
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in ("A", "B")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [record["stage"] for record in profiles["A"].stages] == ["A"]
+    assert [record["stage"] for record in profiles["B"].stages] == ["B"]
+
+
+def test_on_stage_called_at_start_and_end():
+    calls = []
+    profile = Profile("TEST", trace_memory=False)
+    profile.on_stage = lambda record, finished: calls.append((record["stage"], finished))
+    with profile.stage("save"):
+        pass
+    assert calls == [("save", False), ("save", True)]
@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import uuid
+import logging
+import tracemalloc
+import contextvars
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# One JSON line per stage, e.g. {"event": "stage", "app": "BANQUE", "stage": "lookup", "seconds": 0.24, ...}
+logger = logging.getLogger("soyaprim.pipeline")
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(os.environ.get("SOYAPRIM_LOG_LEVEL", "INFO"))
+    logger.propagate = False
+
+# Per-stage peak of traced Python allocations; precise but slows the pipeline down.
+# tracemalloc is process-wide: with several jobs running at once (SOYAPRIM_JOBS > 1)
+# each stage also counts the others' allocations and they reset each other's peak,
+# so the numbers only hold when one job runs at a time.
+TRACE_MEMORY = os.environ.get("SOYAPRIM_TRACE_MEMORY") == "1"
+
+_current = contextvars.ContextVar("soyaprim_profile", default=None)
+
+
+def rss_mb():
+    # Current resident memory of the process, None where /proc is not available
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / 1e6, 1)
+
+
+def peak_rss_mb():
+    # High-water mark of the whole process since it started (kilobytes on Linux)
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class Profile:
+    """Stages of one pipeline run: wall time, rows processed and memory.
+
+    Memory is the resident size of the process at the end of each stage and
+    its change during the stage. Other threads (concurrent jobs, other
+    sessions) share the process, so a delta is exact only when the stage ran
+    alone.
+    """
+
+    def __init__(self, app, trace_memory=TRACE_MEMORY):
+        self.app = app
+        self.run_id = uuid.uuid4().hex[:12]
+        self.trace_memory = trace_memory
+        self.stages = []
+        # Called with (record, finished) when a stage starts and ends (see jobs.Job)
+        self.on_stage = None
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        record = {"stage": name, "rows": rows}
+        if self.on_stage is not None:
+            self.on_stage(record, False)
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        rss_start = rss_mb()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = round(time.perf_counter() - start, 4)
+            record["rss_mb"] = rss_mb()
+            if rss_start is not None and record["rss_mb"] is not None:
+                record["rss_delta_mb"] = round(record["rss_mb"] - rss_start, 1)
+            if tracing:
+                record["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 1e6, 1)
+            self.stages.append(record)
+            logger.info(json.dumps({"event": "stage", "app": self.app, "run": self.run_id, **record}))
+            if self.on_stage is not None:
+                self.on_stage(record, True)
+
+    @property
+    def total_seconds(self):
+        return sum(record["seconds"] for record in self.stages)
+
+    def as_frame(self):
+        import pandas as pd
+        return pd.DataFrame(self.stages)
+
+
+@contextmanager
+def profiling(app, trace_memory=TRACE_MEMORY):
+    """Collect the stages run inside this block (in this thread) into a Profile."""
+    profile = Profile(app, trace_memory)
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+        if started_tracing:
+            tracemalloc.stop()
+        if profile.stages:
+            logger.info(json.dumps({
+                "event": "run", "app": app, "run": profile.run_id,
+                "seconds": round(profile.total_seconds, 4), "process_peak_rss_mb": peak_rss_mb(),
+            }))
+
+
+@contextmanager
+def stage(name, rows=None):
+    """Time a pipeline stage; does nothing outside a profiling() block.
+
+    Yields a dict where the stage can set "rows" once known.
+    """
+    profile = _current.get()
+    if profile is None:
+        yield {}
+        return
+    with profile.stage(name, rows) as record:
+        yield record
+
+
+def show_profile(profile):
+    """Optional Streamlit expander with the stages of the last run."""
+    import streamlit as st
+    with st.expander("Détails d'exécution"):
+        if profile.stages:
+            st.dataframe(profile.as_frame())
+            st.caption(f"Total : {profile.total_seconds:.2f} s")
+        else:
+            st.caption("Résultat déjà calculé pour ce fichier (cache).")
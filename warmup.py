@@ -0,0 +1,70 @@
+"""Preload the pipelines in the server process so that the first upload does not pay for imports.
+
+Streamlit has no server start hook: main.py calls start() on the first page
+load when SOYAPRIM_WARMUP=1, and the preload runs in a background thread
+while the sidebar renders. `python warmup.py` runs the same preload in the
+foreground and prints what each step cost (useful in a container build,
+where it also leaves the .pyc files and the compiled mappings on disk).
+"""
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger("soyaprim.pipeline")
+
+ENABLED = os.environ.get("SOYAPRIM_WARMUP") == "1"
+
+_started = False
+_lock = threading.Lock()
+
+
+def preload():
+    """Import the app modules and their heavy dependencies, load the rules and the master mappings.
+
+    Returns the seconds taken by each step.
+    """
+    timings = {}
+
+    def step(name, load):
+        start = time.perf_counter()
+        load()
+        timings[name] = round(time.perf_counter() - start, 4)
+
+    step("pandas", lambda: __import__("pandas"))
+    step("openpyxl", lambda: __import__("openpyxl"))
+    step("xlsxwriter", lambda: __import__("xlsxwriter"))
+    for module in ("bq", "bq_ref", "achats"):
+        step(module, lambda module=module: __import__(module))
+
+    from rules import load_rules
+    from mapping_cache import MAPPINGS
+    step("rules", lambda: [load_rules(name) for name in ("cpt_rules.csv", "ref_rules.csv")])
+    step("mappings", MAPPINGS.latest)
+    return timings
+
+
+def run():
+    try:
+        timings = preload()
+    except Exception as e:  # A failed warm-up only means a slower first upload
+        logger.warning(f"Préchargement impossible : {e}")
+        return
+    logger.info(f'{{"event": "warmup", "seconds": {round(sum(timings.values()), 4)}}}')
+
+
+def start():
+    """Preload once per server process, in a background thread (no-op unless SOYAPRIM_WARMUP=1)."""
+    global _started
+    if not ENABLED:
+        return
+    with _lock:
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=run, name="soyaprim-warmup", daemon=True).start()
+
+
+if __name__ == "__main__":
+    for name, seconds in preload().items():
+        print(f"{name:<12} {seconds:>8.3f} s")